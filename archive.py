@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+ZIP_METHODS = {
+    "stored": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+ZIP_LEVELS = {"stored": (0, 0), "deflate": (0, 9), "bzip2": (1, 9), "lzma": (0, 0)}
+DEFAULT_ZIP_LEVELS = {"stored": 0, "deflate": 6, "bzip2": 9, "lzma": 0}
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ParallelZipWriter:
+    """Build a zip archive whose members are compressed concurrently.
+
+    Each member is compressed into its own temporary stream by a worker
+    (zlib, bz2 and lzma release the GIL), then the finished streams are
+    copied into the archive in order behind a regular local header. Workers
+    run at most one member per worker ahead of the archive, so temporary
+    files never hold more than that. Stored members have nothing to compress
+    and are streamed straight into the archive.
+    """
+
+    def __init__(self, zip_path, method="deflate", level=None, workers=None, progress_callback=None,
+                 abort_check=None):
+        if method not in ZIP_METHODS:
+            raise ValueError(f"Unsupported zip method: {method}")
+        self.zip_path = zip_path
+        self.method = method
+        self.level = DEFAULT_ZIP_LEVELS[method] if level is None else level
+        self.workers = workers or os.cpu_count() or 1
+        self.progress_callback = progress_callback
+        self.abort_check = abort_check or (lambda: False)
+        self.lock = threading.Lock()
+        self.processed_bytes = 0
+        self.total_bytes = 0
+        self.last_percentage = -1
+
+    def write_folder(self, folder):
+        members = []
+        for root, _, files in os.walk(folder):
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                members.append((file_path, os.path.relpath(file_path, folder)))
+        self.total_bytes = sum(os.path.getsize(file_path) for file_path, _ in members)
+
+        if self.method == "stored":
+            with zipfile.ZipFile(self.zip_path, "w") as zipf:
+                for file_path, arcname in members:
+                    if not self.store_member(zipf, file_path, arcname):
+                        return False
+            return True
+
+        temp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(self.zip_path)))
+        try:
+            with zipfile.ZipFile(self.zip_path, "w") as zipf, ThreadPoolExecutor(max_workers=self.workers) as executor:
+                pending = deque()
+                remaining = iter(members)
+                for file_path, arcname in remaining:
+                    pending.append(executor.submit(self.compress_member, file_path, arcname, temp_dir))
+                    if len(pending) == self.workers:
+                        break
+                while pending:
+                    if self.abort_check():
+                        for future in pending:
+                            future.cancel()
+                        return False
+                    zinfo, temp_path = pending.popleft().result()
+                    if zinfo is None:
+                        return False
+                    self.append_member(zipf, zinfo, temp_path)
+                    # The next member only starts once one has left its temporary file for the archive
+                    member = next(remaining, None)
+                    if member is not None:
+                        pending.append(executor.submit(self.compress_member, *member, temp_dir))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        return True
+
+    def store_member(self, zipf, file_path, arcname):
+        zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+        zinfo.compress_type = zipfile.ZIP_STORED
+        with open(file_path, "rb") as source, zipf.open(zinfo, "w") as target:
+            while True:
+                if self.abort_check():
+                    return False
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                target.write(chunk)
+                self.report_progress(len(chunk), arcname)
+        return True
+
+    def compress_member(self, file_path, arcname, temp_dir):
+        zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+        zinfo.compress_type = ZIP_METHODS[self.method]
+        # zipfile's own factory also writes the LZMA properties header zip readers expect
+        compressor = zipfile._get_compressor(zinfo.compress_type, self.level)
+
+        crc = 0
+        file_size = 0
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        with open(file_path, "rb") as source, os.fdopen(fd, "wb") as target:
+            while True:
+                if self.abort_check():
+                    return None, None
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                file_size += len(chunk)
+                target.write(compressor.compress(chunk) if compressor else chunk)
+                self.report_progress(len(chunk), arcname)
+            if compressor:
+                target.write(compressor.flush())
+
+        zinfo.CRC = crc
+        zinfo.file_size = file_size
+        zinfo.compress_size = os.path.getsize(temp_path)
+        return zinfo, temp_path
+
+    def append_member(self, zipf, zinfo, temp_path):
+        # Same bookkeeping ZipFile.write does, with the compressed bytes already prepared
+        zinfo.header_offset = zipf.fp.tell()
+        zipf.fp.write(zinfo.FileHeader())
+        with open(temp_path, "rb") as compressed:
+            shutil.copyfileobj(compressed, zipf.fp, CHUNK_SIZE)
+        os.remove(temp_path)
+        zipf.filelist.append(zinfo)
+        zipf.NameToInfo[zinfo.filename] = zinfo
+        zipf.start_dir = zipf.fp.tell()
+
+    def report_progress(self, byte_count, arcname):
+        with self.lock:
+            self.processed_bytes += byte_count
+            percentage = int(self.processed_bytes * 100 / self.total_bytes) if self.total_bytes else 100
+            if percentage == self.last_percentage:
+                return
+            self.last_percentage = percentage
+        if self.progress_callback:
+            self.progress_callback(percentage, arcname)
@@ -0,0 +1,339 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import uuid
+
+import pymongo
+from bson import Binary, ObjectId, UUID_SUBTYPE, encode, decode_all
+from bson.json_util import dumps, loads
+
+import export_engine
+from archive import ParallelZipWriter
+from columnar import infer_schema, ParquetWriter, SCHEMA_SAMPLE_SIZE
+from compression import CheckpointWriter, COMPRESSIONS, COMPRESSION_SUFFIXES, zstandard
+from export_engine import ExportEngine, BATCH_SIZE, DEFAULT_MAX_WORKERS, OUTPUT_FORMATS
+from serializers import NDJSONEncoder, orjson
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+BENCHMARK_DB = "mdbexport_benchmark"
+
+# Documents per insert_many while the synthetic dataset is loaded
+LOAD_BATCH_SIZE = 1000
+
+# Stages timed on their own, in the order the export runs them
+STAGES = ("count_estimated", "count_exact", "fetch", "serialize", "write", "zip", "export")
+
+BASE_TIME = datetime.datetime(2024, 1, 1)
+
+
+def object_id(rng, index):
+    # Increasing timestamps like real ObjectIds, but reproducible for a given seed
+    return ObjectId(struct.pack(">I", 1704067200 + index) + rng.randbytes(8))
+
+
+def random_string(rng, length):
+    return "".join(rng.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=length))
+
+
+def nested_document(rng, nesting):
+    document = {"code": random_string(rng, 8), "amount": rng.random() * 1000, "count": rng.randint(0, 1000)}
+    if nesting > 1:
+        document["child"] = nested_document(rng, nesting - 1)
+    return document
+
+
+def synthetic_document(rng, index, size, nesting):
+    """ Document with the common BSON types, padded to about size bytes of BSON """
+    document = {
+        "_id": object_id(rng, index),
+        "index": index,
+        "created": BASE_TIME + datetime.timedelta(seconds=index, milliseconds=rng.randint(0, 999)),
+        "price": round(rng.random() * 100, 2),
+        "active": rng.random() < 0.5,
+        "tags": [random_string(rng, 6) for _ in range(rng.randint(0, 4))],
+    }
+    if nesting > 0:
+        document["nested"] = nested_document(rng, nesting)
+    padding = size - len(encode(document)) - len("payload") - 7
+    document["payload"] = random_string(rng, max(padding, 0))
+    return document
+
+
+def shaped_value(rng, value, index):
+    """ Random value of the same type and size as the one in a sample document """
+    if isinstance(value, dict):
+        return {key: shaped_value(rng, item, index) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shaped_value(rng, item, index) for item in value]
+    if isinstance(value, bool):
+        return rng.random() < 0.5
+    if isinstance(value, int):
+        return rng.randint(0, max(abs(value) * 2, 1000))
+    if isinstance(value, float):
+        return rng.random() * max(abs(value) * 2, 1.0)
+    if isinstance(value, str):
+        return random_string(rng, len(value))
+    if isinstance(value, datetime.datetime):
+        return BASE_TIME + datetime.timedelta(seconds=index)
+    if isinstance(value, ObjectId):
+        return object_id(rng, index)
+    return value
+
+
+def shaped_document(rng, index, shape):
+    document = shaped_value(rng, shape, index)
+    document["_id"] = object_id(rng, index)
+    return document
+
+
+def generate_dataset(db, collections, documents, size, nesting, seed, shape=None):
+    rng = random.Random(seed)
+    for number in range(collections):
+        collection = db[f"collection_{number:03d}"]
+        batch = []
+        for index in range(documents):
+            if shape is not None:
+                batch.append(shaped_document(rng, index, shape))
+            else:
+                batch.append(synthetic_document(rng, index, size, nesting))
+            if len(batch) == LOAD_BATCH_SIZE:
+                collection.insert_many(batch)
+                batch = []
+        if batch:
+            collection.insert_many(batch)
+
+
+def use_mongomock():
+    """ In-memory client for the benchmark, with the cursor and command support mongomock lacks """
+    from mongomock.collection import Collection
+    from mongomock.database import Database
+
+    def find_raw_batches(self, filter=None, projection=None, sort=None, batch_size=BATCH_SIZE, **options):
+        documents = list(self.find(filter or {}, projection, sort=sort))
+        for start in range(0, len(documents), batch_size):
+            yield b"".join(encode(document) for document in documents[start:start + batch_size])
+
+    def list_collections(self, filter=None, **options):
+        names = self.list_collection_names()
+        # Shaped like a server's reply, whose info.uuid pymongo decodes as bson.Binary
+        return iter([{"name": name, "type": "collection", "options": {},
+                      "info": {"readOnly": False, "uuid": Binary(uuid.uuid4().bytes, UUID_SUBTYPE)}}
+                     for name in names if not filter or filter.get("name") == name])
+
+    Collection.find_raw_batches = find_raw_batches
+    Database.list_collections = list_collections
+    client = mongomock.MongoClient()
+    export_engine.MongoClient = lambda uri, **options: client
+    return client
+
+
+def stage_result(seconds, documents, byte_count):
+    return {
+        "seconds": seconds,
+        "documents": documents,
+        "bytes": byte_count,
+        "documents_per_second": documents / seconds if seconds else 0.0,
+        "bytes_per_second": byte_count / seconds if seconds else 0.0,
+    }
+
+
+def serialize_batch(batch, output_format, encoder):
+    if output_format == "ndjson":
+        return encoder.encode_batch(decode_all(batch))
+    if output_format == "json":
+        return "".join(dumps(document, indent=4) + "\n" for document in decode_all(batch)).encode()
+    if output_format == "parquet":
+        # Decoding only; building the Arrow columns is part of writing
+        return decode_all(batch)
+    return batch
+
+
+def write_serialized(file_path, chunks, options, encoder):
+    if options.output_format == "parquet":
+        documents = [document for chunk in chunks for document in chunk]
+        writer = ParquetWriter(file_path, infer_schema(documents[:SCHEMA_SAMPLE_SIZE]), encoder,
+                               options.compression, options.compression_level)
+        writer.write(documents)
+        writer.close()
+        return
+    with CheckpointWriter(file_path, options.compression, options.compression_level) as file:
+        for data in chunks:
+            file.write(data)
+
+
+def run_stages(client, options, work_dir):
+    """ Time each stage of one export on its own, then the whole export end to end """
+    db = client[BENCHMARK_DB]
+    names = sorted(db.list_collection_names())
+    output_format = options.output_format
+    results = {}
+
+    start = time.perf_counter()
+    documents = sum(db[name].estimated_document_count() for name in names)
+    results["count_estimated"] = stage_result(time.perf_counter() - start, documents, 0)
+
+    start = time.perf_counter()
+    documents = sum(db[name].count_documents({}) for name in names)
+    results["count_exact"] = stage_result(time.perf_counter() - start, documents, 0)
+
+    # Fetched batches stay in memory so the following stages time nothing but themselves
+    start = time.perf_counter()
+    batches = {name: list(db[name].find_raw_batches({}, sort=[("_id", 1)], batch_size=options.batch_size))
+               for name in names}
+    fetched = sum(len(batch) for collection_batches in batches.values() for batch in collection_batches)
+    results["fetch"] = stage_result(time.perf_counter() - start, documents, fetched)
+
+    encoder = NDJSONEncoder()
+    start = time.perf_counter()
+    serialized = {name: [serialize_batch(batch, output_format, encoder) for batch in collection_batches]
+                  for name, collection_batches in batches.items()}
+    byte_count = 0 if output_format == "parquet" else sum(len(data) for chunks in serialized.values() for data in chunks)
+    results["serialize"] = stage_result(time.perf_counter() - start, documents, byte_count)
+
+    write_dir = os.path.join(work_dir, "write")
+    os.makedirs(write_dir)
+    start = time.perf_counter()
+    for name, chunks in serialized.items():
+        suffix = "" if output_format == "parquet" else COMPRESSION_SUFFIXES[options.compression]
+        write_serialized(os.path.join(write_dir, f"{name}.{output_format}{suffix}"), chunks, options, encoder)
+    written = sum(os.path.getsize(os.path.join(write_dir, file)) for file in os.listdir(write_dir))
+    results["write"] = stage_result(time.perf_counter() - start, documents, written)
+
+    zip_method = "deflate" if options.compression == "none" and output_format != "parquet" else "stored"
+    start = time.perf_counter()
+    ParallelZipWriter(os.path.join(work_dir, "write.zip"), zip_method, workers=options.workers).write_folder(write_dir)
+    results["zip"] = stage_result(time.perf_counter() - start, documents, written)
+
+    engine = ExportEngine(options.uri or "mongodb://localhost", BENCHMARK_DB, os.path.join(work_dir, "export"),
+                          max_workers=options.workers, partitions=options.partitions, output_format=output_format,
+                          compression=options.compression, compression_level=options.compression_level,
+                          batch_size=options.batch_size, serializer_processes=options.serializer_processes,
+                          resumable=False)
+    start = time.perf_counter()
+    engine.run()
+    if engine.status != "completed":
+        raise RuntimeError(f"Export failed: {engine.errors}")
+    exported = sum(os.path.getsize(os.path.join(root, file))
+                   for root, _, files in os.walk(engine.output_dir) for file in files)
+    results["export"] = stage_result(time.perf_counter() - start, documents, exported)
+    return results
+
+
+def summarize(runs):
+    # The fastest run is the least disturbed by everything else running on the machine
+    summary = {}
+    for stage in STAGES:
+        seconds = [run[stage]["seconds"] for run in runs]
+        best = min(runs, key=lambda run: run[stage]["seconds"])[stage]
+        summary[stage] = dict(best, median_seconds=statistics.median(seconds))
+    return summary
+
+
+def environment():
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pymongo": pymongo.version,
+        "orjson": orjson is not None,
+        "zstandard": zstandard is not None,
+    }
+
+
+def compare(summary, baseline_path):
+    with open(baseline_path) as file:
+        baseline = json.load(file)["stages"]
+    for stage in STAGES:
+        if stage in baseline and baseline[stage]["seconds"]:
+            change = (summary[stage]["seconds"] / baseline[stage]["seconds"] - 1) * 100
+            print(f"{stage:16} {baseline[stage]['seconds']:9.3f}s -> {summary[stage]['seconds']:9.3f}s "
+                  f"({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every export stage on a synthetic dataset.")
+    parser.add_argument("--uri", help="MongoDB to benchmark against (default: in-memory mongomock)")
+    parser.add_argument("--collections", type=int, default=4)
+    parser.add_argument("--documents", type=int, default=10000, help="documents per collection")
+    parser.add_argument("--document-size", type=int, default=512, help="approximate BSON bytes per document")
+    parser.add_argument("--nesting", type=int, default=2, help="levels of embedded documents")
+    parser.add_argument("--shape", help="Extended JSON sample document to generate documents like")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", dest="output_format", choices=OUTPUT_FORMATS, default="ndjson")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="none")
+    parser.add_argument("--compression-level", type=int)
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--partitions", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--serializer-processes", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest is reported")
+    parser.add_argument("--output", default="benchmark-results.json", help="JSON results file")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark database afterwards")
+    options = parser.parse_args(argv)
+
+    if options.uri:
+        client = pymongo.MongoClient(options.uri)
+    elif mongomock is None:
+        parser.error("mongomock is not installed (pip install mongomock); pass --uri to use a mongod instead")
+    else:
+        client = use_mongomock()
+
+    shape = None
+    if options.shape:
+        with open(options.shape) as file:
+            shape = loads(file.read())
+
+    client.drop_database(BENCHMARK_DB)
+    start = time.perf_counter()
+    generate_dataset(client[BENCHMARK_DB], options.collections, options.documents, options.document_size,
+                     options.nesting, options.seed, shape)
+    load_seconds = time.perf_counter() - start
+
+    runs = []
+    try:
+        for run in range(options.repeat):
+            work_dir = tempfile.mkdtemp(prefix="mdbexport-benchmark-")
+            try:
+                runs.append(run_stages(client, options, work_dir))
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        if not options.keep:
+            client.drop_database(BENCHMARK_DB)
+
+    summary = summarize(runs)
+    # The URI may hold credentials, results only record which kind of server was used
+    config = {key: value for key, value in vars(options).items() if key not in ("uri", "output", "baseline")}
+    config["server"] = "mongod" if options.uri else "mongomock"
+    results = {"environment": environment(), "config": config, "load_seconds": load_seconds,
+               "stages": summary, "runs": runs}
+    with open(options.output, "w") as file:
+        json.dump(results, file, indent=4)
+
+    for stage in STAGES:
+        stats = summary[stage]
+        print(f"{stage:16} {stats['seconds']:9.3f}s {stats['documents_per_second']:14,.0f} docs/s "
+              f"{stats['bytes_per_second'] / 1024 / 1024:10.1f} MB/s")
+    if options.baseline:
+        compare(summary, options.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+from bson import encode
+from bson.json_util import dumps, loads, CANONICAL_JSON_OPTIONS
+
+from compression import CheckpointWriter, COMPRESSION_SUFFIXES
+from defaults import DEFAULT_ROLL_SIZE_MB, DEFAULT_FLUSH_INTERVAL
+
+
+# Kept in the output directory, next to watermarks.json
+FOLLOW_FILE = "follow.json"
+# Rolling change files are written here inside the dated export folder
+CHANGES_DIR = "changes"
+
+# Formats change events can be written in; the others follow as NDJSON
+CHANGE_FORMATS = ("ndjson", "bson")
+
+
+# Buffered event bytes that force a flush before the interval is up
+FLUSH_BYTES = 8 * 1024 * 1024
+
+# How long one getMore waits for new events, which also bounds how late an abort is noticed
+MAX_AWAIT_TIME_MS = 1000
+
+
+class FollowState:
+    """Resume tokens of the change streams followed into one output directory.
+
+    Each database records the export folder it follows into, whether its
+    snapshot has finished, and the token of the last event already on disk.
+    """
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, FOLLOW_FILE)
+        self.lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                self.data = loads(file.read())
+
+    def get(self, db_name):
+        return self.data.get(db_name)
+
+    def update(self, db_name, **fields):
+        with self.lock:
+            self.data.setdefault(db_name, {}).update(fields)
+            # Replaced atomically, a crash leaves the previous token and never a torn file
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as file:
+                file.write(dumps(self.data, indent=4, json_options=CANONICAL_JSON_OPTIONS))
+            os.replace(temp_path, self.path)
+
+
+class ChangeFollower:
+    """Append a database's change events to rolling files until aborted.
+
+    Events are buffered and flushed on FLUSH_BYTES or flush_interval; the
+    resume token is saved only after the flushed data is fsynced, so a
+    restart replays at most the events of one unfinished flush.
+    """
+
+    def __init__(self, db, export_dir, state, db_name, output_format="ndjson", compression="none", level=None,
+                 encoder=None, roll_size_mb=DEFAULT_ROLL_SIZE_MB, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 counter=None, abort_check=None):
+        self.db = db
+        self.changes_dir = os.path.join(export_dir, CHANGES_DIR)
+        self.state = state
+        self.db_name = db_name
+        self.output_format = output_format if output_format in CHANGE_FORMATS else "ndjson"
+        self.compression = compression
+        self.level = level
+        self.encoder = encoder
+        self.roll_size = roll_size_mb * 1024 * 1024
+        self.flush_interval = flush_interval
+        self.counter = counter
+        self.abort_check = abort_check or (lambda: False)
+        self.file = None
+        self.file_path = None
+        self.buffer = []
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+
+    def encode(self, event):
+        if self.output_format == "bson":
+            return encode(event)
+        return self.encoder.encode(event) + b"\n"
+
+    def open_next_file(self):
+        # A restart always starts a new file, so nothing already written is touched again
+        entry = self.state.get(self.db_name) or {}
+        sequence = entry.get("sequence", 0) + 1
+        self.state.update(self.db_name, sequence=sequence)
+        name = f"changes-{sequence:06d}.{self.output_format}{COMPRESSION_SUFFIXES[self.compression]}"
+        self.file_path = os.path.join(self.changes_dir, name)
+        self.file = CheckpointWriter(self.file_path, self.compression, self.level)
+
+    def flush(self, resume_token):
+        if self.buffer:
+            if self.file is None:
+                self.open_next_file()
+            data = b"".join(self.buffer)
+            self.file.write(data)
+            self.file.checkpoint()
+            self.counter.add(len(self.buffer), len(data))
+            self.buffer = []
+            self.buffered = 0
+        self.state.update(self.db_name, resume_token=resume_token)
+        self.last_flush = time.monotonic()
+        if self.file is not None and os.path.getsize(self.file_path) >= self.roll_size:
+            self.file.close()
+            self.file = None
+
+    def run(self, resume_token):
+        os.makedirs(self.changes_dir, exist_ok=True)
+        try:
+            with self.db.watch(resume_after=resume_token, full_document="updateLookup",
+                               max_await_time_ms=MAX_AWAIT_TIME_MS) as stream:
+                while not self.abort_check() and stream.alive:
+                    event = stream.try_next()
+                    if event is not None:
+                        data = self.encode(event)
+                        self.buffer.append(data)
+                        self.buffered += len(data)
+                    # Advances past the last event, or past an empty batch, so idle periods aren't replayed
+                    resume_token = stream.resume_token
+                    if self.buffered >= FLUSH_BYTES or time.monotonic() - self.last_flush >= self.flush_interval:
+                        self.flush(resume_token)
+                    if event is not None and event["operationType"] == "invalidate":
+                        raise RuntimeError(f"Change stream of {self.db_name} was invalidated "
+                                           f"(database dropped or renamed).")
+        finally:
+            self.flush(resume_token)
+            if self.file is not None:
+                self.file.close()
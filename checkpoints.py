@@ -0,0 +1,181 @@
+import os
+import shutil
+import threading
+import time
+
+from bson.json_util import dumps, loads, CANONICAL_JSON_OPTIONS
+
+from defaults import CHECKPOINT_FILE, CHECKPOINT_DIR
+
+
+# Seconds between checkpoints of a part that is being written
+CHECKPOINT_INTERVAL = 5.0
+
+
+def resume_query(query, last_id):
+    if last_id is None:
+        return query
+    # $expr compares in BSON order across types, so collections with mixed _id types resume correctly too
+    after = {"$expr": {"$gt": ["$_id", last_id]}}
+    return {"$and": [query, after]} if query else after
+
+
+class PartCheckpoint:
+    """Resume position of one output file: the last _id fully written and the byte offset after it.
+
+    Documents written so far are kept too, and once the part is done the
+    manifest entries (size, hash, documents) of the files it wrote.
+    """
+
+    def __init__(self, store, collection_name, index, entry):
+        self.store = store
+        self.collection_name = collection_name
+        self.index = index
+        self.file_path = os.path.join(store.export_dir, entry["path"])
+        self.query = entry["query"]
+        self.last_id = entry["last_id"]
+        self.offset = entry["offset"]
+        self.done = entry["done"]
+        self.documents = entry.get("documents", 0)
+        self.files = entry.get("files", [])
+        self.last_save = time.monotonic()
+
+    def due(self):
+        return self.store.saved(self.collection_name) and time.monotonic() - self.last_save >= CHECKPOINT_INTERVAL
+
+    def save(self, last_id, offset, documents=0, done=False, files=None):
+        self.last_id = last_id
+        self.offset = offset
+        self.documents = documents
+        self.done = done
+        self.files = self.store.update_part(self.collection_name, self.index, last_id, offset, documents, done,
+                                            files or [])
+        self.last_save = time.monotonic()
+
+
+class CheckpointStore:
+    """Checkpoints of every collection and part of one export folder.
+
+    Each collection has its own file, replaced atomically whenever one of its
+    parts moves on, so after a crash it always describes data that is already
+    on disk, and an update costs the same however many collections the export
+    has. The settings that decide what the files contain (format, compression,
+    filters) are recorded once, and only a resume with the same settings may
+    append to them.
+    """
+
+    def __init__(self, export_dir, enabled=True, settings=None, resume=False):
+        self.export_dir = export_dir
+        self.path = os.path.join(export_dir, CHECKPOINT_FILE)
+        self.collections_dir = os.path.join(export_dir, CHECKPOINT_DIR)
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.collection_locks = {}
+        # Collections tracked for the manifest only, never written to disk
+        self.unsaved = set()
+        # Round-tripped so filters compare equal to the ones read back from the file
+        self.settings = loads(dumps(settings or {}, json_options=CANONICAL_JSON_OPTIONS))
+        self.collections = {}
+        legacy = False
+        # A fresh export never continues files it finds, leftover checkpoints are replaced
+        if resume and os.path.exists(self.path):
+            with open(self.path) as file:
+                checkpoint = loads(file.read())
+            if "settings" in checkpoint and set(checkpoint) <= {"settings", "collections"}:
+                self.check_settings(checkpoint["settings"])
+                self.collections = checkpoint.get("collections", {})
+            else:
+                # Written before settings were recorded
+                self.collections = checkpoint
+            legacy = bool(self.collections)
+            if os.path.isdir(self.collections_dir):
+                for file_name in os.listdir(self.collections_dir):
+                    if file_name.endswith(".json"):
+                        with open(os.path.join(self.collections_dir, file_name)) as file:
+                            self.collections[file_name[:-len(".json")]] = loads(file.read())
+        elif os.path.isdir(self.collections_dir):
+            shutil.rmtree(self.collections_dir)
+
+        if self.enabled:
+            os.makedirs(self.collections_dir, exist_ok=True)
+            if legacy:
+                # Checkpoints of older versions kept every collection in resume.json
+                for collection_name in self.collections:
+                    self.save(collection_name)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as file:
+                file.write(dumps({"settings": self.settings}, json_options=CANONICAL_JSON_OPTIONS))
+            os.replace(temp_path, self.path)
+
+    def check_settings(self, recorded):
+        for key, value in self.settings.items():
+            if key in recorded and recorded[key] != value:
+                raise ValueError(f"The interrupted export was started with {key}={dumps(recorded[key])}, not "
+                                 f"{dumps(value)}; resume it with the settings it was started with")
+
+    def collection(self, collection_name):
+        return self.collections.get(collection_name)
+
+    def collection_lock(self, collection_name):
+        # Workers of different collections never wait for each other
+        with self.lock:
+            return self.collection_locks.setdefault(collection_name, threading.Lock())
+
+    def saved(self, collection_name):
+        return self.enabled and collection_name not in self.unsaved
+
+    def start_collection(self, collection_name, queries, file_paths, watermark=None, saved=True):
+        with self.collection_lock(collection_name):
+            if not saved:
+                self.unsaved.add(collection_name)
+            self.collections[collection_name] = {
+                "done": False,
+                "watermark": watermark,
+                "parts": [
+                    {"path": os.path.relpath(file_path, self.export_dir), "query": query,
+                     "last_id": None, "offset": 0, "documents": 0, "done": False, "files": []}
+                    for query, file_path in zip(queries, file_paths)
+                ],
+            }
+            self.save(collection_name)
+
+    def parts(self, collection_name):
+        entries = self.collections[collection_name]["parts"]
+        return [PartCheckpoint(self, collection_name, index, entry) for index, entry in enumerate(entries)]
+
+    def relative(self, file_path):
+        # Manifest paths, which are also the member names in the zip
+        return os.path.relpath(file_path, self.export_dir).replace(os.sep, "/")
+
+    def update_part(self, collection_name, index, last_id, offset, documents, done, files):
+        files = [dict(entry, path=self.relative(entry["path"])) for entry in files]
+        with self.collection_lock(collection_name):
+            self.collections[collection_name]["parts"][index].update(
+                last_id=last_id, offset=offset, documents=documents, done=done, files=files)
+            self.save(collection_name)
+        return files
+
+    def finish_collection(self, collection_name, files):
+        with self.collection_lock(collection_name):
+            self.collections[collection_name].update(done=True, files=files)
+            self.save(collection_name)
+
+    def manifest_entries(self):
+        """ Files of every finished collection, for the manifest """
+        return {name: state.get("files", []) for name, state in self.collections.items() if state["done"]}
+
+    def save(self, collection_name):
+        if not self.saved(collection_name):
+            return
+        path = os.path.join(self.collections_dir, f"{collection_name}.json")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            file.write(dumps(self.collections[collection_name], json_options=CANONICAL_JSON_OPTIONS))
+        os.replace(temp_path, path)
+
+    def remove(self):
+        # A completed export has nothing left to resume
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        if os.path.isdir(self.collections_dir):
+            shutil.rmtree(self.collections_dir)
@@ -0,0 +1,266 @@
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+
+from bson.json_util import dumps, loads, RELAXED_JSON_OPTIONS
+
+from export_engine import ExportEngine, DEFAULT_MAX_WORKERS, read_script
+from job_runner import JobRunner, read_jobs
+from restore_engine import RestoreEngine, OffsetIndex, verify_export, INSERT_BATCH_SIZE
+from snapshot_store import SnapshotRepository, REPOSITORY_FILE
+
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_ABORTED = 3
+EXIT_PARTIAL = 4
+
+EXIT_CODES = {
+    "completed": EXIT_OK,
+    "empty": EXIT_OK,
+    "failed": EXIT_FAILED,
+    "aborted": EXIT_ABORTED,
+    "partial": EXIT_PARTIAL,
+}
+
+
+def emit(event, **fields):
+    # One JSON object per line so schedulers and log shippers can parse progress
+    print(json.dumps({"event": event, **fields}), flush=True)
+
+
+def emit_progress(snapshot, **fields):
+    emit("progress", **fields, collection=snapshot.current, percentage=round(snapshot.percentage, 2),
+         documents=snapshot.documents, total=snapshot.total, bytes=snapshot.bytes,
+         documents_per_second=round(snapshot.documents_per_second, 1),
+         bytes_per_second=round(snapshot.bytes_per_second, 1), eta=round(snapshot.eta, 1), measure=snapshot.measure,
+         stages=snapshot.stages)
+
+
+def emit_zip_progress(percentage, file_name, **fields):
+    emit("zip_progress", **fields, percentage=percentage, file=file_name)
+
+
+def parse_id(text):
+    # Extended JSON such as {"$oid": "..."} or 42, anything that isn't JSON is a string _id
+    try:
+        return loads(text)
+    except ValueError:
+        return text
+
+
+def run_engine(engine):
+    # Ctrl+C or a scheduler's SIGTERM stops the engine at a resumable point
+    signal.signal(signal.SIGINT, lambda *_: engine.abort())
+    signal.signal(signal.SIGTERM, lambda *_: engine.abort())
+
+    engine.run()
+
+
+def export(argv):
+    parser = argparse.ArgumentParser(description="Run a .mdbexport backup script without the GUI.")
+    parser.add_argument("script", help="backup script created with File ==> Create Backup Script")
+    parser.add_argument("--resume", metavar="EXPORT_DIR", help="continue the interrupted export in this dated folder")
+    args = parser.parse_args(argv)
+
+    try:
+        uri, db_name, output_dir, options = read_script(args.script)
+        engine = ExportEngine(uri, db_name, output_dir, resume_dir=args.resume,
+                              progress_callback=emit_progress,
+                              zip_progress_callback=emit_zip_progress,
+                              finished_callback=lambda message: emit("finished", message=message),
+                              error_callback=lambda message: emit("error", message=message),
+                              **options)
+    except (OSError, ValueError, KeyError) as e:
+        emit("error", message=f"Invalid backup script: {e}")
+        return EXIT_USAGE
+
+    run_engine(engine)
+    emit("summary", status=engine.status, output_dir=engine.output_dir, errors=engine.errors)
+    return EXIT_CODES[engine.status]
+
+
+def restore(argv):
+    parser = argparse.ArgumentParser(prog="cli.py restore",
+                                     description="Load an export folder or zip back into a database.")
+    parser.add_argument("source", help="dated export folder or its zip")
+    parser.add_argument("--uri", required=True, help="MongoDB URI to restore into")
+    parser.add_argument("--db", required=True, help="database to restore into")
+    parser.add_argument("--source-db", help="database the export was taken from, if it differs from --db")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="collections restored at once")
+    parser.add_argument("--batch-size", type=int, default=INSERT_BATCH_SIZE, help="documents per insert_many")
+    parser.add_argument("--drop", action="store_true", help="drop each collection before loading it")
+    parser.add_argument("--rebuild-indexes", action="store_true",
+                        help="create the indexes recorded in BSON exports after loading")
+    parser.add_argument("--include", nargs="*", help="collection name patterns to restore")
+    parser.add_argument("--exclude", nargs="*", help="collection name patterns to skip")
+    args = parser.parse_args(argv)
+
+    try:
+        engine = RestoreEngine(args.source, args.uri, args.db, source_db=args.source_db, max_workers=args.workers,
+                               batch_size=args.batch_size, drop=args.drop, rebuild_indexes=args.rebuild_indexes,
+                               include=args.include, exclude=args.exclude,
+                               progress_callback=emit_progress,
+                               finished_callback=lambda message: emit("finished", message=message),
+                               error_callback=lambda message: emit("error", message=message))
+    except ValueError as e:
+        emit("error", message=str(e))
+        return EXIT_USAGE
+
+    run_engine(engine)
+    emit("summary", status=engine.status, documents=engine.inserted, errors=engine.errors)
+    return EXIT_CODES[engine.status]
+
+
+def jobs(argv):
+    parser = argparse.ArgumentParser(prog="cli.py jobs",
+                                     description="Export every database listed in a .mdbjobs file concurrently.")
+    parser.add_argument("job_file", help="job file listing backup scripts or inline jobs")
+    parser.add_argument("--summary", metavar="PATH", help="also write the combined summary to this JSON file")
+    args = parser.parse_args(argv)
+
+    try:
+        job_list, limits = read_jobs(args.job_file)
+        runner = JobRunner(job_list, **limits,
+                           progress_callback=lambda job, snapshot: emit_progress(snapshot, job=job),
+                           zip_progress_callback=lambda job, *progress: emit_zip_progress(*progress, job=job),
+                           finished_callback=lambda job, message: emit("finished", job=job, message=message),
+                           error_callback=lambda job, message: emit("error", job=job, message=message))
+    except (OSError, ValueError, KeyError) as e:
+        emit("error", message=f"Invalid job file: {e}")
+        return EXIT_USAGE
+
+    run_engine(runner)
+    summary = runner.summary()
+    emit("summary", **summary)
+    if args.summary:
+        with open(args.summary, "w") as file:
+            json.dump(summary, file, indent=4)
+    return EXIT_CODES[runner.status]
+
+
+def verify(argv):
+    parser = argparse.ArgumentParser(prog="cli.py verify",
+                                     description="Check an export folder or zip against its manifest.json.")
+    parser.add_argument("source", help="dated export folder or its zip")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="files hashed at once")
+    args = parser.parse_args(argv)
+
+    try:
+        summary = verify_export(args.source, args.workers, lambda message: emit("error", message=message))
+    except (OSError, ValueError, KeyError) as e:
+        emit("error", message=f"Can't read the manifest: {e}")
+        return EXIT_USAGE
+
+    emit("summary", **summary)
+    return EXIT_CODES[summary["status"]]
+
+
+def lookup(argv):
+    parser = argparse.ArgumentParser(prog="cli.py lookup",
+                                     description="Print one document of an indexed export by its _id.")
+    parser.add_argument("index", help="<collection>.idx file written next to the exported files")
+    parser.add_argument("id", help='_id as Extended JSON, e.g. \'{"$oid": "..."}\' or 42')
+    args = parser.parse_args(argv)
+
+    try:
+        index = OffsetIndex(args.index)
+    except (OSError, ValueError, KeyError) as e:
+        emit("error", message=f"Invalid offset index: {e}")
+        return EXIT_USAGE
+
+    document = index.lookup(parse_id(args.id))
+    if document is None:
+        emit("summary", status="not_found", documents=0)
+        return EXIT_FAILED
+    print(dumps(document, json_options=RELAXED_JSON_OPTIONS), flush=True)
+    return EXIT_OK
+
+
+def extract(argv):
+    parser = argparse.ArgumentParser(prog="cli.py extract",
+                                     description="Write the documents of an _id range of an indexed export.")
+    parser.add_argument("index", help="<collection>.idx file written next to the exported files")
+    parser.add_argument("--from", dest="lower", required=True, help="first _id of the range, as Extended JSON")
+    parser.add_argument("--to", dest="upper", required=True, help="last _id of the range, as Extended JSON")
+    parser.add_argument("--output", required=True, help="NDJSON file to write the documents to")
+    args = parser.parse_args(argv)
+
+    try:
+        index = OffsetIndex(args.index)
+    except (OSError, ValueError, KeyError) as e:
+        emit("error", message=f"Invalid offset index: {e}")
+        return EXIT_USAGE
+
+    count = 0
+    with open(args.output, "w") as file:
+        for document in index.extract(parse_id(args.lower), parse_id(args.upper)):
+            file.write(dumps(document, json_options=RELAXED_JSON_OPTIONS) + "\n")
+            count += 1
+    emit("summary", status="completed", documents=count, output=args.output)
+    return EXIT_OK
+
+
+def repo(argv):
+    parser = argparse.ArgumentParser(prog="cli.py repo",
+                                     description="List, restore and clean up the snapshots of a snapshot repository.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    list_parser = subparsers.add_parser("list", help="list the snapshots and the repository size")
+    list_parser.add_argument("repository")
+    list_parser.add_argument("--db", help="only the snapshots of this database")
+    restore_parser = subparsers.add_parser("restore", help="write a snapshot back into an export folder")
+    restore_parser.add_argument("repository")
+    restore_parser.add_argument("db_name")
+    restore_parser.add_argument("snapshot", help="dated folder name, as shown by list")
+    restore_parser.add_argument("target", help="folder to write the files into")
+    restore_parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="files restored at once")
+    prune_parser = subparsers.add_parser("prune", help="forget old snapshots and delete their unshared chunks")
+    prune_parser.add_argument("repository")
+    prune_parser.add_argument("--keep", type=int, required=True, help="newest snapshots kept per database")
+    prune_parser.add_argument("--db", help="only prune this database")
+    gc_parser = subparsers.add_parser("gc", help="delete chunks no snapshot references")
+    gc_parser.add_argument("repository")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.join(args.repository, REPOSITORY_FILE)):
+        emit("error", message=f"Not a snapshot repository: {args.repository}")
+        return EXIT_USAGE
+
+    try:
+        repository = SnapshotRepository(args.repository)
+        if args.action == "list":
+            for snapshot in repository.snapshots(args.db):
+                emit("snapshot", **snapshot)
+            emit("summary", status="completed", **repository.stats())
+        elif args.action == "restore":
+            summary = repository.restore(args.db_name, args.snapshot, args.target, args.workers)
+            emit("summary", status="completed", target=args.target, **summary)
+        elif args.action == "prune":
+            removed = repository.prune(args.keep, args.db)
+            emit("summary", status="completed", pruned=removed, **repository.gc())
+        else:
+            emit("summary", status="completed", **repository.gc())
+    except (OSError, ValueError, KeyError) as e:
+        emit("error", message=str(e))
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+# Subcommands; anything else is a backup script path, as before subcommands existed
+COMMANDS = {"restore": restore, "jobs": jobs, "verify": verify, "lookup": lookup, "extract": extract, "repo": repo}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    return export(argv)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
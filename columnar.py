@@ -0,0 +1,190 @@
+import datetime
+import json
+
+from bson import ObjectId, Decimal128
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# Documents sampled per collection to infer its Parquet schema
+SCHEMA_SAMPLE_SIZE = 1000
+
+# Rows buffered and written as one Parquet row group
+ROW_GROUP_SIZE = 100000
+
+# Parquet always compresses its pages; "none" only means no extra stream compression on top
+PARQUET_CODECS = {"none": "snappy", "gzip": "gzip", "zstd": "zstd"}
+
+# Holds, as Extended JSON, every value that doesn't fit its column's inferred type
+OVERFLOW_FIELD = "_overflow"
+
+# Field metadata key recording how a column was derived from the BSON values
+KIND_KEY = b"mongodb_type"
+
+ARROW_TYPES = {
+    "bool": lambda: pa.bool_(),
+    "int": lambda: pa.int64(),
+    "float": lambda: pa.float64(),
+    "string": lambda: pa.string(),
+    "date": lambda: pa.timestamp("ms", tz="UTC"),
+    "objectid": lambda: pa.string(),
+    "decimal": lambda: pa.string(),
+    "binary": lambda: pa.binary(),
+    "json": lambda: pa.string(),
+}
+
+# kind -> (accepts the value, converts it for Arrow)
+SCALAR_KINDS = {
+    "bool": (lambda value: type(value) is bool, None),
+    "int": (lambda value: isinstance(value, int) and type(value) is not bool, None),
+    "float": (lambda value: isinstance(value, (int, float)) and type(value) is not bool, float),
+    "string": (lambda value: isinstance(value, str), None),
+    "date": (lambda value: isinstance(value, datetime.datetime), None),
+    "objectid": (lambda value: isinstance(value, ObjectId), str),
+    "decimal": (lambda value: isinstance(value, Decimal128), str),
+    "binary": (lambda value: isinstance(value, bytes), bytes),
+}
+
+
+class TypeMismatch(Exception):
+    pass
+
+
+def check_parquet():
+    if pa is None:
+        raise ValueError("parquet output requires the pyarrow package (pip install pyarrow)")
+
+
+def value_kind(value):
+    if isinstance(value, dict):
+        return "document"
+    if isinstance(value, list):
+        return "array"
+    for kind, (accepts, _) in SCALAR_KINDS.items():
+        if kind != "float" and accepts(value):
+            return kind
+    return "float" if isinstance(value, float) else "json"
+
+
+def kind_field(name, kind):
+    return pa.field(name, ARROW_TYPES[kind](), metadata={KIND_KEY: kind.encode()})
+
+
+def infer_field(name, values):
+    """ Arrow field for the values a sample holds for one field """
+    values = [value for value in values if value is not None]
+    kinds = {value_kind(value) for value in values}
+    if kinds == {"int", "float"}:
+        kinds = {"float"}
+    # Missing everywhere, or different types in different documents: keep the values as Extended JSON
+    if len(kinds) != 1:
+        return kind_field(name, "json")
+
+    kind = kinds.pop()
+    if kind == "document":
+        keys = list(dict.fromkeys(key for value in values for key in value))
+        if not keys:
+            return kind_field(name, "json")
+        return pa.field(name, pa.struct([infer_field(key, [value.get(key) for value in values]) for key in keys]))
+    if kind == "array":
+        element = infer_field("element", [item for value in values for item in value])
+        return pa.field(name, pa.list_(element))
+    return kind_field(name, kind)
+
+
+def infer_schema(documents):
+    """ Schema of a sample of documents: nested documents become structs, arrays lists """
+    documents = list(documents)
+    keys = list(dict.fromkeys(key for document in documents for key in document))
+    fields = [infer_field(key, [document.get(key) for document in documents]) for key in keys if key != OVERFLOW_FIELD]
+    return pa.schema(fields + [kind_field(OVERFLOW_FIELD, "json")])
+
+
+def field_converter(field, to_json):
+    """ Function turning a BSON value into the Python value Arrow expects for field """
+    if pa.types.is_struct(field.type):
+        children = {child.name: field_converter(child, to_json) for child in field.type}
+
+        def convert(value):
+            if not isinstance(value, dict) or not children.keys() >= value.keys():
+                raise TypeMismatch
+            return {name: child(value.get(name)) for name, child in children.items()}
+    elif pa.types.is_list(field.type):
+        element = field_converter(field.type.value_field, to_json)
+
+        def convert(value):
+            if not isinstance(value, list):
+                raise TypeMismatch
+            return [element(item) for item in value]
+    elif field.metadata[KIND_KEY] == b"json":
+        convert = to_json
+    else:
+        accepts, transform = SCALAR_KINDS[field.metadata[KIND_KEY].decode()]
+
+        def convert(value):
+            if not accepts(value):
+                raise TypeMismatch
+            return transform(value) if transform else value
+
+    return lambda value: None if value is None else convert(value)
+
+
+class ParquetWriter:
+    """Write decoded documents into a Parquet file, one row group per ROW_GROUP_SIZE rows.
+
+    A top-level value that doesn't match the inferred schema, or a field the
+    sample never saw, is stored under OVERFLOW_FIELD instead of being lost.
+    """
+
+    def __init__(self, file, schema, encoder, compression="none", level=None, row_group_size=ROW_GROUP_SIZE):
+        self.schema = schema
+        self.encoder = encoder
+        self.row_group_size = row_group_size
+        options = {"compression": PARQUET_CODECS[compression]}
+        if compression != "none" and level is not None:
+            options["compression_level"] = level
+        # A path, or a binary file object that is left open
+        self.writer = pq.ParquetWriter(file, schema, **options)
+        self.converters = {field.name: field_converter(field, self.to_json)
+                           for field in schema if field.name != OVERFLOW_FIELD}
+        self.documents = []
+
+    def to_json(self, value):
+        return json.dumps(self.encoder.convert(value), separators=(",", ":"), ensure_ascii=False)
+
+    def write(self, documents):
+        self.documents.extend(documents)
+        if len(self.documents) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.documents:
+            return
+        columns = {name: [] for name in self.schema.names}
+        for document in self.documents:
+            overflow = {}
+            for name, converter in self.converters.items():
+                value = document.get(name)
+                try:
+                    columns[name].append(converter(value))
+                except TypeMismatch:
+                    columns[name].append(None)
+                    overflow[name] = value
+            for name in document.keys() - self.converters.keys():
+                overflow[name] = document[name]
+            columns[OVERFLOW_FIELD].append(self.to_json(overflow) if overflow else None)
+
+        arrays = [pa.array(columns[field.name], type=field.type) for field in self.schema]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema), row_group_size=self.row_group_size)
+        self.documents = []
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.writer.close()
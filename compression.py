@@ -0,0 +1,115 @@
+import gzip
+import io
+import os
+
+from manifest import HashingFile, file_entry, hash_stream
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Per-file compression applied while each collection is written
+COMPRESSIONS = ("none", "gzip", "zstd")
+COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+COMPRESSION_LEVELS = {"none": (0, 0), "gzip": (1, 9), "zstd": (1, 22)}
+DEFAULT_COMPRESSION_LEVELS = {"none": 0, "gzip": 6, "zstd": 3}
+
+
+def check_compression(compression):
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression: {compression}")
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd compression requires the zstandard package (pip install zstandard)")
+
+
+def open_compressed(file_path, compression="none", level=None):
+    """ Open file_path for binary writing, compressing the stream on the fly """
+    if level is None:
+        level = DEFAULT_COMPRESSION_LEVELS[compression]
+
+    if compression == "gzip":
+        return gzip.open(file_path, "wb", compresslevel=level)
+    if compression == "zstd":
+        # Closing the stream writer flushes the frame and closes the file
+        return zstandard.ZstdCompressor(level=level).stream_writer(open(file_path, "wb"))
+    return open(file_path, "wb")
+
+
+def open_decompressed(file, compression="none"):
+    """ Wrap a binary file object so reading it returns the decompressed, buffered stream """
+    if compression == "gzip":
+        # Reads every member, including the ones CheckpointWriter starts at each checkpoint
+        return gzip.GzipFile(fileobj=file, mode="rb")
+    if compression == "zstd":
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True))
+    return io.BufferedReader(file)
+
+
+class CheckpointWriter:
+    """Compressing binary writer that can be cut back to any checkpoint and appended to later.
+
+    A checkpoint ends the current gzip member or zstd frame, so the bytes up to
+    the returned offset are a complete stream on their own. Concatenated
+    members and frames decode as one stream. The stored bytes are hashed and
+    the documents counted as they are written, for the export manifest.
+    """
+
+    def __init__(self, file_path, compression="none", level=None, offset=None, documents=0):
+        self.file_path = file_path
+        self.compression = compression
+        self.level = DEFAULT_COMPRESSION_LEVELS[compression] if level is None else level
+        self.documents = documents
+        if offset is None:
+            self.file = HashingFile(open(file_path, "wb"))
+        else:
+            # Resume: drop whatever was written after the last checkpoint
+            file = open(file_path, "r+b" if os.path.exists(file_path) else "wb")
+            file.truncate(offset)
+            # Only the part written before the interruption is read again, to carry its hash forward
+            file.seek(0)
+            size, digest = hash_stream(file, offset)
+            file.seek(offset)
+            self.file = HashingFile(file, size, digest)
+        self.stream = self.open_stream()
+
+    def open_stream(self):
+        if self.compression == "gzip":
+            return gzip.GzipFile(fileobj=self.file, mode="wb", compresslevel=self.level)
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).stream_writer(self.file, closefd=False)
+        return self.file
+
+    def write(self, data, first_id=None, last_id=None, count=0):
+        # The _id range only matters to rolling.RollingWriter, which takes the same calls
+        self.stream.write(data)
+        self.documents += count
+
+    def checkpoint(self, sync=True):
+        if self.compression == "gzip":
+            self.stream.close()
+        elif self.compression == "zstd":
+            self.stream.flush(zstandard.FLUSH_FRAME)
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+        offset = self.file.tell()
+        if self.compression == "gzip":
+            self.stream = self.open_stream()
+        return offset
+
+    def close(self):
+        if self.stream is not self.file:
+            self.stream.close()
+        self.size = self.file.tell()
+        self.file.close()
+
+    def manifest_entries(self):
+        return [file_entry(self.file_path, self.size, self.file.hash.hexdigest(), self.documents)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
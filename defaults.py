@@ -0,0 +1,29 @@
+# Option defaults and choices shared by the engines and the GUI. Nothing here may
+# import pymongo, bson or Qt: the window builds its widgets from these before
+# the export modules are loaded.
+
+# Upper bound on collections exported at the same time; every worker shares the one MongoClient pool
+DEFAULT_MAX_WORKERS = 8
+
+
+# Output formats: compact one-document-per-line Extended JSON, the original pretty-printed
+# Extended JSON, raw BSON in the layout mongorestore reads, or columnar Parquet
+OUTPUT_FORMATS = ("ndjson", "json", "bson", "parquet")
+DEFAULT_OUTPUT_FORMAT = "ndjson"
+
+# Documents fetched per cursor round trip
+BATCH_SIZE = 10000
+
+READ_PREFERENCES = ("primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest")
+
+# Wire compressors in order of preference; the server picks the first one it also supports
+WIRE_COMPRESSORS = ("zstd", "snappy", "zlib")
+
+# Written into the dated export folder while an export is running: the settings, and a file per collection
+CHECKPOINT_FILE = "resume.json"
+CHECKPOINT_DIR = "resume"
+
+DEFAULT_MEMORY_LIMIT_MB = 512
+
+DEFAULT_ROLL_SIZE_MB = 256
+DEFAULT_FLUSH_INTERVAL = 1.0
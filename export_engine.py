@@ -0,0 +1,834 @@
+import os
+import datetime
+import fnmatch
+import functools
+import shutil
+import struct
+import threading
+from uuid import UUID
+from concurrent.futures import ThreadPoolExecutor, wait
+from pymongo import MongoClient
+from bson import ObjectId, decode, decode_all
+from bson.json_util import dumps, loads, CANONICAL_JSON_OPTIONS
+
+from archive import ParallelZipWriter, ZIP_METHODS
+from change_stream import FollowState, ChangeFollower, CHANGES_DIR
+from defaults import (
+    DEFAULT_MAX_WORKERS, OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT, BATCH_SIZE, READ_PREFERENCES, WIRE_COMPRESSORS,
+    DEFAULT_MEMORY_LIMIT_MB, DEFAULT_ROLL_SIZE_MB, DEFAULT_FLUSH_INTERVAL, CHECKPOINT_FILE
+)
+from columnar import check_parquet, infer_schema, ParquetWriter, SCHEMA_SAMPLE_SIZE
+from progress import ProgressTracker, ProgressReporter
+from rolling import RollingWriter, write_index, blocks_path, line_ends, bson_ends, INDEX_SUFFIX
+from checkpoints import CheckpointStore, resume_query
+from manifest import HashingFile, file_entry, hash_file, write_manifest
+from compression import check_compression, open_compressed, CheckpointWriter, COMPRESSIONS, COMPRESSION_SUFFIXES
+from pipeline import SerializationPipeline
+from serializers import NDJSONEncoder
+from snapshot_store import SnapshotRepository
+from utils import format_bytes
+from watermarks import WatermarkStore
+
+
+# .mdbexport keys passed straight through to ExportEngine, next to the required uri, db_name and output_dir
+SCRIPT_OPTIONS = (
+    "max_workers", "partitions", "merge_parts", "output_format", "canonical_json", "compression",
+    "compression_level", "archive", "zip_method", "zip_level", "exact_count", "incremental", "watermark_field",
+    "watermark_fields", "resumable", "include", "exclude", "collection_options", "max_pool_size", "compressors",
+    "read_preference", "batch_size", "max_time_ms", "no_cursor_timeout", "serializer_processes", "memory_limit_mb",
+    "follow", "roll_size_mb", "flush_interval", "max_file_size_mb", "max_file_documents", "offset_index",
+    "repository", "keep_snapshots",
+)
+
+# Collections smaller than partitions * MIN_PARTITION_DOCUMENTS are not worth splitting
+MIN_PARTITION_DOCUMENTS = 100000
+
+# _id samples drawn per partition when picking range boundaries
+SAMPLES_PER_PARTITION = 20
+
+# _id types whose BSON and Python orderings agree, so sampled boundaries give valid ranges
+PARTITIONABLE_ID_TYPES = (ObjectId, int, datetime.datetime)
+
+# Seconds the export waits for collection sizes before starting with the ones it has
+COLLECTION_SIZES_TIMEOUT = 10.0
+
+
+def collection_size(db, collection_name):
+    # Views and collections we are not allowed to stat simply sort last
+    try:
+        return db.command("collStats", collection_name).get("size", 0)
+    except Exception:
+        return 0
+
+
+def collection_sizes(db, collection_names, workers, timeout=COLLECTION_SIZES_TIMEOUT):
+    """ Sizes of the collections, fetched concurrently; those not in after timeout seconds are left out """
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(collection_names))))
+    futures = {name: executor.submit(collection_size, db, name) for name in collection_names}
+    wait(futures.values(), timeout)
+    for future in futures.values():
+        future.cancel()
+    executor.shutdown(wait=False)
+    return {name: future.result() for name, future in futures.items() if future.done() and not future.cancelled()}
+
+
+def id_ranges(collection, partitions):
+    # Pick boundaries from a $sample of _ids instead of a full $bucketAuto scan
+    sample = collection.aggregate([
+        {"$sample": {"size": partitions * SAMPLES_PER_PARTITION}},
+        {"$project": {"_id": 1}},
+    ])
+    ids = [document["_id"] for document in sample]
+
+    # Range queries only match _ids of a single BSON type, so mixed collections are read in one pass
+    id_types = {type(_id) for _id in ids}
+    if len(ids) < partitions or len(id_types) != 1 or not issubclass(id_types.pop(), PARTITIONABLE_ID_TYPES):
+        return None
+
+    ids.sort()
+    boundaries = sorted({ids[len(ids) * index // partitions] for index in range(1, partitions)})
+
+    ranges = [{"_id": {"$lt": boundaries[0]}}]
+    for lower, upper in zip(boundaries, boundaries[1:]):
+        ranges.append({"_id": {"$gte": lower, "$lt": upper}})
+    ranges.append({"_id": {"$gte": boundaries[-1]}})
+    return ranges
+
+
+def count_bson_documents(batch):
+    # Walk the int32 length prefixes of a raw batch without decoding any document
+    count = 0
+    offset = 0
+    last_offset = 0
+    while offset < len(batch):
+        last_offset = offset
+        offset += struct.unpack_from("<i", batch, offset)[0]
+        count += 1
+    return count, last_offset
+
+
+def write_bson_metadata(db, collection_name, metadata_path, compression="none", level=None):
+    info = next(db.list_collections(filter={"name": collection_name}), {})
+    metadata = {
+        "indexes": list(db[collection_name].list_indexes()),
+        "options": info.get("options", {}),
+        "collectionName": collection_name,
+        "type": info.get("type", "collection"),
+    }
+    uuid = info.get("info", {}).get("uuid")
+    if uuid is not None:
+        # pymongo decodes it as bson.Binary under the default uuid representation, as uuid.UUID under others;
+        # mongodump writes the 16 bytes as 32 hex digits
+        metadata["uuid"] = uuid.hex if isinstance(uuid, UUID) else bytes(uuid).hex()
+    with open_compressed(metadata_path, compression, level) as file:
+        file.write(dumps(metadata, json_options=CANONICAL_JSON_OPTIONS).encode())
+
+
+def drops_id(projection):
+    return bool(projection) and not projection.get("_id", True)
+
+
+def match_collections(collections, include=None, exclude=None):
+    if include:
+        collections = [name for name in collections
+                       if any(fnmatch.fnmatchcase(name, pattern) for pattern in include)]
+    if exclude:
+        collections = [name for name in collections
+                       if not any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude)]
+    return collections
+
+
+def newest_value(collection, field):
+    # Highest value of field right now; an index on it keeps this a single key lookup
+    document = next(collection.find({field: {"$exists": True}}, {field: 1}).sort(field, -1).limit(1), None)
+    for key in field.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(key)
+    return document
+
+
+def combine_queries(*queries):
+    queries = [query for query in queries if query]
+    if len(queries) > 1:
+        return {"$and": queries}
+    return queries[0] if queries else {}
+
+
+def concatenate_parts(part_paths, output_path):
+    """ Returns the (size, hash) of the merged file, taken while it is copied """
+    with open(output_path, "wb") as file:
+        output = HashingFile(file)
+        for part_path in part_paths:
+            with open(part_path, "rb") as part:
+                shutil.copyfileobj(part, output)
+    # Parts are only removed once the merged file is complete, so a crash mid-merge can redo it
+    for part_path in part_paths:
+        os.remove(part_path)
+    return output.size, output.hash.hexdigest()
+
+
+def read_script(file_name):
+    # Extended JSON, so filters can use {"$oid": ...}, {"$date": ...} and friends
+    with open(file_name, 'r') as file:
+        backup_data = loads(file.read())
+    options = {key: backup_data[key] for key in SCRIPT_OPTIONS if key in backup_data}
+    return backup_data['uri'], backup_data['db_name'], backup_data['output_dir'], options
+
+
+def client_options(max_pool_size=None, compressors=None, read_preference=None):
+    """ MongoClient keyword arguments for the script's connection settings """
+    if read_preference and read_preference not in READ_PREFERENCES:
+        raise ValueError(f"Unsupported read preference: {read_preference}")
+    if isinstance(compressors, str):
+        compressors = [name.strip() for name in compressors.split(",") if name.strip()]
+    for compressor in compressors or []:
+        if compressor not in WIRE_COMPRESSORS:
+            raise ValueError(f"Unsupported wire compressor: {compressor}")
+    # Only options that were set are passed, anything else keeps the URI's or pymongo's default
+    options = {}
+    if max_pool_size:
+        options["maxPoolSize"] = int(max_pool_size)
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    if read_preference:
+        options["readPreference"] = read_preference
+    return options
+
+
+def ignore(*args):
+    pass
+
+
+class ExportEngine:
+    """Export one database to a dated folder without any GUI dependency.
+
+    Everything is reported through the callbacks: progress_callback gets a
+    ProgressSnapshot, zip_progress_callback a percentage and member name, and
+    finished_callback / error_callback a message. After run() returns, status
+    is one of "completed", "partial" (some collections failed), "empty",
+    "aborted" or "failed".
+    """
+
+    def __init__(self, uri, db_name, output_dir, max_workers=DEFAULT_MAX_WORKERS, partitions=1, merge_parts=True,
+                 output_format=DEFAULT_OUTPUT_FORMAT, canonical_json=False, compression="none",
+                 compression_level=None, archive=True, zip_method=None, zip_level=None, exact_count=False,
+                 incremental=False, watermark_field="_id", watermark_fields=None, resumable=True,
+                 resume_dir=None, include=None, exclude=None, collection_options=None, max_pool_size=None,
+                 compressors=None, read_preference=None, batch_size=BATCH_SIZE, max_time_ms=None,
+                 no_cursor_timeout=False, serializer_processes=0, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB,
+                 follow=False, roll_size_mb=DEFAULT_ROLL_SIZE_MB, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_file_size_mb=None, max_file_documents=None, offset_index=False, repository=None,
+                 keep_snapshots=None, client=None,
+                 progress_callback=ignore, zip_progress_callback=ignore, finished_callback=ignore,
+                 error_callback=ignore):
+        self.uri = uri
+        self.db_name = db_name
+        self.output_dir = output_dir
+        self.max_workers = max(1, int(max_workers))
+        # Caps the _id range cursors open at once across all collections, partitioned ones included
+        self.range_slots = threading.BoundedSemaphore(self.max_workers)
+        self.partitions = max(1, int(partitions))
+        self.merge_parts = merge_parts
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format: {output_format}")
+        self.output_format = output_format
+        self.encoder = NDJSONEncoder(canonical=canonical_json)
+        if output_format == "parquet":
+            check_parquet()
+            # Parquet compresses its own pages, so zstd doesn't need the zstandard package here
+            if compression not in COMPRESSIONS:
+                raise ValueError(f"Unsupported compression: {compression}")
+        else:
+            check_compression(compression)
+        self.compression = compression
+        self.compression_level = compression_level
+        self.archive = archive
+        # Snapshot repository mode: the dated folder is stored as deduplicated chunks, then removed
+        self.repository = repository
+        self.keep_snapshots = int(keep_snapshots) if keep_snapshots else None
+        self.chunk_compression = "none"
+        if repository:
+            if follow:
+                raise ValueError("Follow changes writes into the export folder, which a snapshot repository replaces")
+            if output_format != "parquet":
+                # Compressed files differ entirely after the first change, so the chunks are compressed instead
+                self.chunk_compression = compression
+                self.compression = "none"
+            self.archive = False
+        # Already-compressed files are only bundled by default, deflating them again gains nothing
+        if zip_method is None:
+            zip_method = "deflate" if compression == "none" and output_format != "parquet" else "stored"
+        if zip_method not in ZIP_METHODS:
+            raise ValueError(f"Unsupported zip method: {zip_method}")
+        self.zip_method = zip_method
+        self.zip_level = zip_level
+        self.exact_count = exact_count
+        self.incremental = incremental
+        self.watermark_field = watermark_field or "_id"
+        self.watermark_fields = watermark_fields or {}
+        self.watermarks = None
+        self.resumable = resumable or resume_dir is not None
+        self.resume_dir = resume_dir
+        self.checkpoints = None
+        self.include = include or []
+        self.exclude = exclude or []
+        # Collection name (or pattern) -> {"filter", "projection", "hint"} applied server-side
+        self.collection_options = collection_options or {}
+        self.client_options = client_options(max_pool_size, compressors, read_preference)
+        self.batch_size = max(1, int(batch_size or BATCH_SIZE))
+        self.max_time_ms = max_time_ms or None
+        self.no_cursor_timeout = no_cursor_timeout
+        # JSON encoding is CPU bound, so it can move to worker processes; BSON is written as fetched
+        self.serializer_processes = max(0, int(serializer_processes or 0))
+        self.memory_limit_mb = max(1, int(memory_limit_mb or DEFAULT_MEMORY_LIMIT_MB))
+        self.pipeline = None
+        # After the snapshot, keep appending the database's change stream until aborted
+        self.follow = follow
+        self.roll_size_mb = max(1, int(roll_size_mb or DEFAULT_ROLL_SIZE_MB))
+        self.flush_interval = float(flush_interval or DEFAULT_FLUSH_INTERVAL)
+        self.follow_state = None
+        # Size- or document-capped part files, and the _id offset index written next to them
+        self.max_file_size = int(float(max_file_size_mb) * 1024 * 1024) if max_file_size_mb else None
+        self.max_file_documents = int(max_file_documents) if max_file_documents else None
+        self.rolling = bool(self.max_file_size or self.max_file_documents)
+        self.indexed = self.rolling or bool(offset_index)
+        if self.indexed and output_format == "parquet":
+            raise ValueError("Rolling files and offset indexes need the ndjson, json or bson format; "
+                             "Parquet files are split into row groups instead")
+        if self.indexed and any(drops_id(options.get("projection")) for options in self.collection_options.values()):
+            raise ValueError("Rolling files and offset indexes need the _id of every document; "
+                             "remove \"_id\": 0 from the projections")
+        # A client shared with other engines (see job_runner); it is left open for its owner
+        self.client = client
+        self.abort_flag = False
+        self.total_collections = 0
+        self.progress = None
+        self.progress_callback = progress_callback
+        self.zip_progress_callback = zip_progress_callback
+        self.finished_callback = finished_callback
+        self.error_callback = error_callback
+        self.status = None
+        self.errors = []
+
+    def run(self):
+        try:
+            if not os.path.exists(self.output_dir):
+                os.makedirs(self.output_dir)
+
+            if self.incremental:
+                self.watermarks = WatermarkStore(self.output_dir, self.db_name)
+
+            follow_entry = None
+            if self.follow:
+                self.follow_state = FollowState(self.output_dir)
+                follow_entry = self.follow_state.get(self.db_name)
+                if (follow_entry and follow_entry.get("snapshot_complete") and not self.resume_dir
+                        and os.path.isdir(follow_entry["export_dir"])):
+                    # The snapshot is already on disk, only the change stream continues
+                    self.output_dir = follow_entry["export_dir"]
+                    self.follow_changes()
+                    return
+
+            if self.resume_dir:
+                # Continue in the dated folder of the interrupted export
+                self.output_dir = self.resume_dir
+            else:
+                now = datetime.datetime.now()
+                date_str = now.strftime("%d-%m-%Y")
+                if self.incremental and os.path.exists(os.path.join(self.output_dir, date_str)):
+                    # A second run on the same day must not overwrite the export its delta chains to
+                    date_str = now.strftime("%d-%m-%Y_%H%M%S")
+                elif self.repository and os.path.exists(
+                        self.open_repository().snapshot_path(self.db_name, date_str)):
+                    # Nor replace the snapshot stored earlier that day
+                    date_str = now.strftime("%d-%m-%Y_%H%M%S")
+                elif os.path.exists(os.path.join(self.output_dir, date_str, CHECKPOINT_FILE)):
+                    # Nor write over an interrupted export, which stays resumable from its own folder
+                    date_str = now.strftime("%d-%m-%Y_%H%M%S")
+                self.output_dir = os.path.join(self.output_dir, date_str)
+
+            if not os.path.exists(self.output_dir):
+                os.makedirs(self.output_dir)
+
+            self.checkpoints = CheckpointStore(self.output_dir, self.resumable, self.checkpoint_settings(),
+                                               resume=self.resume_dir is not None)
+
+            client = self.connect()
+            db = client[self.db_name]
+            collections = match_collections(db.list_collection_names(), self.include, self.exclude)
+            self.total_collections = len(collections)
+
+            if self.follow and not (follow_entry and follow_entry.get("export_dir") == self.output_dir):
+                # Taken before the snapshot starts, so changes made while it runs are replayed afterwards
+                with db.watch() as stream:
+                    resume_token = stream.resume_token
+                self.follow_state.update(self.db_name, export_dir=self.output_dir, resume_token=resume_token,
+                                         snapshot_complete=False, sequence=0)
+
+            if self.total_collections == 0 and not self.follow:
+                self.finish("empty", "No collections found in the database.")
+                return
+
+            # Largest collections first so a single huge one doesn't finish last; collections whose size
+            # didn't arrive in time follow in name order
+            sizes = collection_sizes(db, collections, self.max_workers)
+            collections.sort()
+            collections.sort(key=lambda name: sizes.get(name, 0), reverse=True)
+
+            # Progress is aggregated and emitted by the reporter alone, never by the workers
+            self.progress = ProgressTracker()
+            if self.serializer_processes and self.output_format in ("ndjson", "json"):
+                self.pipeline = SerializationPipeline(self.serializer_processes, self.memory_limit_mb,
+                                                      self.encoder.canonical, self.output_format == "json",
+                                                      boundaries=self.indexed)
+                self.progress.stage_stats = self.pipeline.stage_stats
+            reporter = ProgressReporter(self.progress, self.progress_callback)
+            reporter.start()
+
+            try:
+                # Bounded pool of workers instead of one thread per collection
+                with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(collections)))) as executor:
+                    futures = [executor.submit(self.process_collection, db, name) for name in collections]
+                    for future in futures:
+                        if self.abort_flag:
+                            for pending in futures:
+                                pending.cancel()
+                            break
+                        future.result()
+            finally:
+                reporter.stop()
+                if self.pipeline is not None:
+                    self.pipeline.close()
+
+            if self.abort_flag:
+                self.disconnect(client)
+                self.finish("aborted", "Export aborted by user." + (" Use Resume to continue." if self.resumable else ""))
+                return
+
+            self.disconnect(client)
+            self.checkpoints.remove()
+
+            if self.watermarks is not None:
+                self.watermarks.save(self.output_dir)
+            # Hashed while the data was written; the zip carries the manifest along
+            write_manifest(self.output_dir, self.db_name, self.checkpoints.manifest_entries())
+
+            if self.repository:
+                message = self.store_snapshot()
+                if message is None:
+                    return
+            elif not self.archive:
+                message = f"Export completed successfully! \n Saved at: {self.output_dir}"
+            else:
+                # Zip the folder
+                zip_file_path = self.zip_output_folder()
+                if zip_file_path is None:
+                    return
+                message = f"Export completed successfully! \n Zipped at: {zip_file_path}"
+
+            if self.follow:
+                self.follow_state.update(self.db_name, snapshot_complete=True)
+                self.follow_changes()
+                return
+            self.finish("completed", message)
+        except Exception as e:
+            self.status = "failed"
+            self.report_error(str(e))
+
+    def follow_changes(self):
+        client = self.connect()
+        self.progress = ProgressTracker()
+        self.progress.set_state(CHANGES_DIR, "following")
+        follower = ChangeFollower(client[self.db_name], self.output_dir, self.follow_state, self.db_name,
+                                  self.output_format, self.compression, self.compression_level, self.encoder,
+                                  self.roll_size_mb, self.flush_interval, self.progress.counter(CHANGES_DIR),
+                                  lambda: self.abort_flag)
+        reporter = ProgressReporter(self.progress, self.progress_callback)
+        reporter.start()
+        try:
+            follower.run(self.follow_state.get(self.db_name)["resume_token"])
+        finally:
+            reporter.stop()
+            self.disconnect(client)
+        self.finish("aborted", f"Stopped following changes of {self.db_name}. \n "
+                               f"Follow again to continue from the saved resume token.")
+
+    def connect(self):
+        return self.client or MongoClient(self.uri, **self.client_options)
+
+    def disconnect(self, client):
+        if client is not self.client:
+            client.close()
+
+    def process_collection(self, db, collection_name):
+        if self.abort_flag:
+            return
+        try:
+            collection = db[collection_name]
+            state = self.checkpoints.collection(collection_name)
+
+            if state and state["done"]:
+                # Finished before the export was interrupted
+                self.record_watermark(collection_name, state["watermark"])
+                self.progress.set_state(collection_name, "done")
+                return
+
+            query = self.options_for(collection_name).get("filter") or {}
+            watermark = None
+            if self.watermarks is not None:
+                # Only documents past the last run's watermark, up to the newest one right now
+                field = self.watermark_fields.get(collection_name, self.watermark_field)
+                lower = self.watermarks.get(collection_name, field)
+                upper = newest_value(collection, field)
+                watermark = [field, lower, upper]
+                if lower is not None:
+                    if upper is None:
+                        self.record_watermark(collection_name, watermark)
+                        self.progress.set_state(collection_name, "done")
+                        return
+                    query = combine_queries(query, {field: {"$gt": lower, "$lte": upper}})
+
+            # Metadata count for progress; count_documents would scan the whole collection first
+            total_documents = collection.estimated_document_count()
+            self.progress.set_total(collection_name, total_documents)
+            self.progress.set_state(collection_name, "exporting")
+            if self.exact_count or query:
+                # Refines the total while the export is already running; the estimate of a filtered or
+                # incremental export covers the whole collection, so those are always counted
+                threading.Thread(target=self.count_documents, args=(collection, collection_name, query),
+                                 daemon=True).start()
+
+            # Collection metadata can lag behind, so an estimate of 0 is confirmed before skipping
+            if state or total_documents > 0 or collection.find_one({}, {"_id": 1}) is not None:
+                if self.output_format == "bson":
+                    # mongorestore layout: <dump>/<db>/<collection>.bson + <collection>.metadata.json
+                    db_dir = os.path.join(self.output_dir, self.db_name)
+                    os.makedirs(db_dir, exist_ok=True)
+                    base_path = os.path.join(db_dir, collection_name)
+                    write_bson_metadata(db, collection_name,
+                                        f"{base_path}.metadata.json{COMPRESSION_SUFFIXES[self.compression]}",
+                                        self.compression, self.compression_level)
+                    export_range = self.export_raw_range
+                elif self.output_format == "parquet":
+                    base_path = os.path.join(self.output_dir, f"{self.db_name}_{collection_name}")
+                    # One schema per collection, so the part files of a split collection form one dataset
+                    sample = collection.find(query, self.projection_for(collection_name)).limit(SCHEMA_SAMPLE_SIZE)
+                    schema = infer_schema(sample)
+                    export_range = functools.partial(self.export_parquet_range, schema=schema)
+                else:
+                    base_path = os.path.join(self.output_dir, f"{self.db_name}_{collection_name}")
+                    if self.pipeline is not None:
+                        export_range = self.export_pipelined_range
+                    elif self.output_format == "ndjson":
+                        export_range = self.export_ndjson_range
+                    else:
+                        export_range = self.export_range
+                extension = self.file_extension()
+                output_path = f"{base_path}.{extension}"
+
+                if state is None:
+                    ranges = None
+                    if self.partitions > 1 and total_documents >= self.partitions * MIN_PARTITION_DOCUMENTS:
+                        ranges = id_ranges(collection, self.partitions)
+
+                    if ranges:
+                        # Each _id range gets its own cursor and part file
+                        queries = [combine_queries(query, id_range) for id_range in ranges]
+                        file_paths = [f"{base_path}.part-{index:04d}.{extension}" for index in range(len(ranges))]
+                    else:
+                        queries = [query]
+                        file_paths = [output_path]
+                    # Ranges are kept with the checkpoints so a resume reuses exactly the same split
+                    self.checkpoints.start_collection(collection_name, queries, file_paths, watermark,
+                                                      saved=self.checkpointed(collection_name))
+                    state = self.checkpoints.collection(collection_name)
+                    parts = self.checkpoints.parts(collection_name)
+                else:
+                    watermark = state["watermark"]
+                    parts = self.checkpoints.parts(collection_name)
+                    if self.indexed:
+                        # Index blocks aren't checkpointed, so an unfinished part is written again from its start
+                        for part in parts:
+                            if not part.done:
+                                part.last_id = None
+
+                part_paths = [part.file_path for part in parts]
+                # Parquet files can't be concatenated byte for byte; their parts are read as a dataset
+                # Rolled files stay separate, downstream jobs fan out across them
+                merged = len(parts) > 1 and self.merge_parts and self.output_format != "parquet" and not self.rolling
+                merged_file = None
+
+                if len(parts) > 1:
+                    with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+                        futures = [executor.submit(self.run_range, export_range, collection, collection_name, part)
+                                   for part in parts if not part.done]
+                        for future in futures:
+                            future.result()
+
+                    # After a crash between merging and the final checkpoint the parts are already gone
+                    if merged and not self.abort_flag and all(map(os.path.exists, part_paths)):
+                        merged_file = concatenate_parts(part_paths, output_path)
+                elif not parts[0].done:
+                    self.run_range(export_range, collection, collection_name, parts[0])
+
+                if self.abort_flag:
+                    self.progress.set_state(collection_name, "aborted")
+                    return
+                # The block lists are gone once the index is written, a resume after that leaves it as it is
+                if self.indexed and all(os.path.exists(blocks_path(path)) for path in part_paths):
+                    write_index(base_path + INDEX_SUFFIX, part_paths, self.output_format, self.compression,
+                                output_path if merged else None)
+
+                if merged:
+                    # Merged before an interruption, the file has to be read once to be hashed
+                    size, digest = merged_file or hash_file(output_path)
+                    files = [file_entry(self.checkpoints.relative(output_path), size, digest,
+                                        sum(part.documents for part in parts))]
+                else:
+                    files = [entry for part in parts for entry in part.files]
+                self.checkpoints.finish_collection(collection_name, files)
+
+            self.record_watermark(collection_name, watermark)
+            self.progress.set_state(collection_name, "done")
+        except Exception as e:
+            self.progress.set_state(collection_name, "failed")
+            self.report_error(f"{collection_name}: {e}")
+
+    def checkpoint_settings(self):
+        """ Options that shape the written files; a resume has to match them to append to those files """
+        return {
+            "output_format": self.output_format,
+            "compression": self.compression,
+            "canonical_json": self.encoder.canonical,
+            "collection_options": self.collection_options,
+            "max_file_size": self.max_file_size,
+            "max_file_documents": self.max_file_documents,
+            "offset_index": self.indexed,
+        }
+
+    def run_range(self, export_range, collection, collection_name, part):
+        with self.range_slots:
+            if not self.abort_flag:
+                export_range(collection, collection_name, part)
+
+    def record_watermark(self, collection_name, watermark):
+        if self.watermarks is not None and watermark is not None:
+            self.watermarks.set(collection_name, *watermark)
+
+    def count_documents(self, collection, collection_name, query):
+        try:
+            self.progress.set_total(collection_name, collection.count_documents(query))
+        except Exception:
+            # The estimated total stays in place, the export itself is unaffected
+            pass
+
+    def options_for(self, collection_name):
+        if collection_name in self.collection_options:
+            return self.collection_options[collection_name]
+        for pattern, options in self.collection_options.items():
+            if fnmatch.fnmatchcase(collection_name, pattern):
+                return options
+        return {}
+
+    def projection_for(self, collection_name):
+        return self.options_for(collection_name).get("projection")
+
+    def checkpointed(self, collection_name):
+        # Checkpoints resume after the last written _id, so a collection exported without it takes one pass
+        return self.resumable and not drops_id(self.projection_for(collection_name))
+
+    def open_cursor(self, collection, part, raw=False):
+        query = resume_query(part.query, part.last_id)
+        projection = self.projection_for(collection.name)
+        hint = self.options_for(collection.name).get("hint")
+        # Checkpoints need _id order so everything up to the last saved _id is known to be written,
+        # and the offset index so each block covers one _id range
+        sort = [("_id", 1)] if self.checkpointed(collection.name) or self.indexed else None
+        cursor_options = {"projection": projection, "sort": sort, "hint": hint, "batch_size": self.batch_size,
+                          "max_time_ms": self.max_time_ms, "no_cursor_timeout": self.no_cursor_timeout}
+        if sort and hint:
+            # Sorting by _id while scanning another index may need to spill to disk
+            cursor_options["allow_disk_use"] = True
+        if raw:
+            return collection.find_raw_batches(query, **cursor_options)
+        return collection.find(query, **cursor_options)
+
+    def file_extension(self):
+        # Parquet compression happens inside the file, which keeps its plain extension
+        if self.output_format == "parquet":
+            return self.output_format
+        return self.output_format + COMPRESSION_SUFFIXES[self.compression]
+
+    def open_part(self, part):
+        if self.indexed:
+            return RollingWriter(part.file_path, self.file_extension(), self.compression, self.compression_level,
+                                 self.max_file_size, self.max_file_documents)
+        # A part that was checkpointed before is cut back to its last consistent offset and appended to
+        offset = part.offset if part.last_id is not None else None
+        return CheckpointWriter(part.file_path, self.compression, self.compression_level, offset,
+                                part.documents if offset is not None else 0)
+
+    def export_range(self, collection, collection_name, part):
+        cursor = self.open_cursor(collection, part)
+        counter = self.progress.counter(collection_name)
+        last_id = part.last_id
+
+        with self.open_part(part) as file:
+            for document in cursor:
+                if self.abort_flag:
+                    part.save(last_id, file.checkpoint(), file.documents)
+                    return
+
+                data = (dumps(document, indent=4) + "\n").encode()
+                # Without checkpoints or an index a projection may leave _id out
+                last_id = document.get("_id")
+                file.write(data, last_id, last_id, 1)
+                counter.add(1, len(data))
+                if part.due():
+                    part.save(last_id, file.checkpoint(), file.documents)
+        part.save(last_id, file.size, file.documents, done=True, files=file.manifest_entries())
+
+    def export_ndjson_range(self, collection, collection_name, part):
+        # Whole cursor batches are decoded in one call and written with a single write
+        cursor = self.open_cursor(collection, part, raw=True)
+        counter = self.progress.counter(collection_name)
+        last_id = part.last_id
+
+        with self.open_part(part) as file:
+            for batch in cursor:
+                if self.abort_flag:
+                    part.save(last_id, file.checkpoint(), file.documents)
+                    return
+
+                documents = decode_all(batch)
+                data = self.encoder.encode_batch(documents)
+                first_id = documents[0].get("_id") if documents else None
+                if documents:
+                    last_id = documents[-1].get("_id")
+                if self.indexed:
+                    # A cursor batch is cut into index blocks and capped files line by line
+                    file.write_documents(data, line_ends(data), lambda index: documents[index].get("_id"))
+                else:
+                    file.write(data, first_id, last_id, len(documents))
+                counter.add(len(documents), len(data))
+                if part.due():
+                    part.save(last_id, file.checkpoint(), file.documents)
+        part.save(last_id, file.size, file.documents, done=True, files=file.manifest_entries())
+
+    def export_pipelined_range(self, collection, collection_name, part):
+        # Same output as the in-thread exporters, encoded by the pipeline's serializer processes
+        cursor = self.open_cursor(collection, part, raw=True)
+        counter = self.progress.counter(collection_name)
+
+        with self.open_part(part) as file:
+            last_id = self.pipeline.run(cursor, file, part, counter, lambda: self.abort_flag)
+            if self.abort_flag:
+                part.save(last_id, file.checkpoint(), file.documents)
+                return
+        part.save(last_id, file.size, file.documents, done=True, files=file.manifest_entries())
+
+    def export_parquet_range(self, collection, collection_name, part, schema):
+        # A Parquet file is only readable once its footer is written, so an interrupted part starts over
+        part.last_id = None
+        cursor = self.open_cursor(collection, part, raw=True)
+        counter = self.progress.counter(collection_name)
+        last_id = None
+        written = 0
+
+        with open(part.file_path, "wb") as raw:
+            file = HashingFile(raw)
+            writer = ParquetWriter(file, schema, self.encoder, self.compression, self.compression_level)
+            try:
+                for batch in cursor:
+                    if self.abort_flag:
+                        break
+                    documents = decode_all(batch)
+                    writer.write(documents)
+                    counter.add(len(documents), len(batch))
+                    written += len(documents)
+                    if documents:
+                        last_id = documents[-1].get("_id")
+            finally:
+                writer.close()
+
+        if self.abort_flag:
+            os.remove(part.file_path)
+            part.save(None, 0)
+            return
+        part.save(last_id, file.size, written, done=True,
+                  files=[file_entry(part.file_path, file.size, file.hash.hexdigest(), written)])
+
+    def export_raw_range(self, collection, collection_name, part):
+        # Raw batches are written byte for byte; only the last document of a batch is decoded for its _id
+        cursor = self.open_cursor(collection, part, raw=True)
+        counter = self.progress.counter(collection_name)
+        last_id = part.last_id
+
+        with self.open_part(part) as file:
+            for batch in cursor:
+                if self.abort_flag:
+                    part.save(last_id, file.checkpoint(), file.documents)
+                    return
+
+                count, last_offset = count_bson_documents(batch)
+                if count and (self.checkpointed(collection_name) or self.indexed):
+                    last_id = decode(batch[last_offset:])["_id"]
+                if self.indexed:
+                    ends = bson_ends(batch)
+                    # Only the documents a block or file starts or ends with are decoded for their _id
+                    file.write_documents(batch, ends, lambda index: decode(
+                        batch[ends[index - 1] if index else 0:ends[index]])["_id"])
+                else:
+                    file.write(batch, None, last_id, count)
+                counter.add(count, len(batch))
+                if part.due():
+                    part.save(last_id, file.checkpoint(), file.documents)
+        part.save(last_id, file.size, file.documents, done=True, files=file.manifest_entries())
+
+    def zip_output_folder(self):
+        zip_file_path = f"{self.output_dir}.zip"
+        writer = ParallelZipWriter(zip_file_path, self.zip_method, self.zip_level, workers=self.max_workers,
+                                   progress_callback=self.zip_progress_callback,
+                                   abort_check=lambda: self.abort_flag)
+        if not writer.write_folder(self.output_dir):
+            os.remove(zip_file_path)
+            self.finish("aborted", "Export aborted by user.")
+            return
+
+        return zip_file_path
+
+    def open_repository(self):
+        # The compression only applies when this creates the repository
+        return SnapshotRepository(self.repository, self.chunk_compression, self.compression_level)
+
+    def store_snapshot(self):
+        repository = self.open_repository()
+        name = os.path.basename(self.output_dir)
+        stats = repository.store(self.output_dir, self.db_name, name, workers=self.max_workers,
+                                 progress_callback=self.zip_progress_callback, abort_check=lambda: self.abort_flag)
+        if stats is None:
+            # The folder stays, chunks stored so far are removed by the next gc
+            self.finish("aborted", "Export aborted by user.")
+            return
+        shutil.rmtree(self.output_dir)
+
+        if self.keep_snapshots and repository.prune(self.keep_snapshots, self.db_name):
+            try:
+                repository.gc()
+            except ValueError:
+                # Other exports are storing into the repository; a later run collects the chunks
+                pass
+        return (f"Export completed successfully! \n Stored as snapshot {self.db_name}/{name} in {self.repository} "
+                f"({stats['new_chunks']} of {stats['chunks']} chunks new, {format_bytes(stats['stored_bytes'])} added)")
+
+    def finish(self, status, message):
+        self.status = "partial" if status == "completed" and self.errors else status
+        self.finished_callback(message)
+
+    def report_error(self, message):
+        self.errors.append(message)
+        self.error_callback(message)
+
+    def abort(self):
+        self.abort_flag = True
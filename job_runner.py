@@ -0,0 +1,209 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+from pymongo import MongoClient
+
+from bson.json_util import loads
+
+from export_engine import ExportEngine, SCRIPT_OPTIONS, client_options, read_script, ignore
+
+
+DEFAULT_MAX_JOBS = 4
+DEFAULT_MAX_JOBS_PER_CLUSTER = 2
+
+# Options that configure the shared MongoClient of a URI rather than a single export
+CLIENT_OPTIONS = ("max_pool_size", "compressors", "read_preference")
+
+
+def redact_uri(uri):
+    # Summaries and progress name the cluster without its credentials
+    return re.sub(r"//[^@/]*@", "//", uri)
+
+
+def read_jobs(file_name):
+    """ Jobs of a .mdbjobs file: each is a backup script path or an inline script, merged over the defaults """
+    with open(file_name) as file:
+        job_file = loads(file.read())
+    base_dir = os.path.dirname(os.path.abspath(file_name))
+    defaults = job_file.get("defaults", {})
+
+    jobs = []
+    for entry in job_file["jobs"]:
+        job = dict(defaults)
+        if "script" in entry:
+            uri, db_name, output_dir, options = read_script(os.path.join(base_dir, entry["script"]))
+            job.update(options, uri=uri, db_name=db_name, output_dir=output_dir)
+        job.update({key: value for key, value in entry.items() if key != "script"})
+        jobs.append(job)
+
+    limits = {
+        "max_jobs": job_file.get("max_jobs", DEFAULT_MAX_JOBS),
+        "max_jobs_per_cluster": job_file.get("max_jobs_per_cluster", DEFAULT_MAX_JOBS_PER_CLUSTER),
+        "cluster_limits": job_file.get("cluster_limits", {}),
+    }
+    return jobs, limits
+
+
+class Job:
+    def __init__(self, name, uri, db_name, output_dir, options):
+        self.name = name
+        self.uri = uri
+        self.db_name = db_name
+        self.output_dir = output_dir
+        self.options = options
+        self.engine = None
+        self.status = "queued"
+        self.started = None
+        self.seconds = 0.0
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "cluster": redact_uri(self.uri),
+            "db_name": self.db_name,
+            "status": self.status,
+            "seconds": round(self.seconds, 3),
+            "output_dir": self.engine.output_dir if self.engine else self.output_dir,
+            "errors": self.engine.errors if self.engine else [],
+        }
+
+
+class JobRunner:
+    """Run many database exports concurrently, across any number of clusters.
+
+    At most max_jobs exports run at once, and at most max_jobs_per_cluster
+    (or the URI's entry in cluster_limits) against the same URI. All jobs of
+    a URI share one MongoClient, so its connection pool is reused instead of
+    every database opening its own. Callbacks get the job name first.
+    """
+
+    def __init__(self, jobs, max_jobs=DEFAULT_MAX_JOBS, max_jobs_per_cluster=DEFAULT_MAX_JOBS_PER_CLUSTER,
+                 cluster_limits=None, progress_callback=ignore, zip_progress_callback=ignore,
+                 finished_callback=ignore, error_callback=ignore):
+        self.max_jobs = max(1, int(max_jobs))
+        self.max_jobs_per_cluster = max(1, int(max_jobs_per_cluster))
+        self.cluster_limits = cluster_limits or {}
+        self.progress_callback = progress_callback
+        self.zip_progress_callback = zip_progress_callback
+        self.finished_callback = finished_callback
+        self.error_callback = error_callback
+        self.jobs = self.create_jobs(jobs)
+        self.clients = {}
+        self.condition = threading.Condition()
+        self.running = Counter()
+        self.abort_flag = False
+        self.status = None
+        self.seconds = 0.0
+
+    def create_jobs(self, jobs):
+        names = [job.get("name") or job["db_name"] for job in jobs]
+        duplicates = {name for name, count in Counter(names).items() if count > 1}
+        if duplicates:
+            raise ValueError(f"Give these jobs distinct names: {', '.join(sorted(duplicates))}")
+        # Exports sharing an output directory would share dated folders, checkpoints and zips
+        shared_dirs = {path for path, count in Counter(job["output_dir"] for job in jobs).items() if count > 1}
+
+        created = []
+        for name, job in zip(names, jobs):
+            output_dir = job["output_dir"]
+            if output_dir in shared_dirs:
+                output_dir = os.path.join(output_dir, name)
+            options = {key: job[key] for key in SCRIPT_OPTIONS if key in job}
+            created.append(Job(name, job["uri"], job["db_name"], output_dir, options))
+        return created
+
+    def client_for(self, job):
+        # Called under the condition lock; the first job of a URI decides its pool options
+        if job.uri not in self.clients:
+            options = client_options(**{key: job.options[key] for key in CLIENT_OPTIONS if key in job.options})
+            self.clients[job.uri] = MongoClient(job.uri, **options)
+        return self.clients[job.uri]
+
+    def cluster_limit(self, uri):
+        return self.cluster_limits.get(uri, self.max_jobs_per_cluster)
+
+    def run(self):
+        start = time.monotonic()
+        pending = list(self.jobs)
+        threads = []
+        try:
+            with self.condition:
+                while pending and not self.abort_flag:
+                    # Start every queued job whose cluster still has room, oldest first
+                    for job in list(pending):
+                        if sum(self.running.values()) >= self.max_jobs:
+                            break
+                        if self.running[job.uri] < self.cluster_limit(job.uri):
+                            pending.remove(job)
+                            try:
+                                client = self.client_for(job)
+                            except Exception as e:
+                                job.status = "failed"
+                                self.error_callback(job.name, str(e))
+                                continue
+                            self.running[job.uri] += 1
+                            thread = threading.Thread(target=self.run_job, args=(job, client))
+                            threads.append(thread)
+                            thread.start()
+                    if pending:
+                        self.condition.wait()
+            for thread in threads:
+                thread.join()
+        finally:
+            for client in self.clients.values():
+                client.close()
+
+        for job in pending:
+            job.status = "aborted"
+        self.seconds = time.monotonic() - start
+        statuses = {job.status for job in self.jobs}
+        if self.abort_flag:
+            self.status = "aborted"
+        elif statuses <= {"completed", "empty"}:
+            self.status = "completed"
+        elif statuses == {"failed"}:
+            self.status = "failed"
+        else:
+            self.status = "partial"
+
+    def run_job(self, job, client):
+        job.started = time.monotonic()
+        job.status = "running"
+        try:
+            job.engine = ExportEngine(
+                job.uri, job.db_name, job.output_dir, client=client,
+                progress_callback=lambda snapshot: self.progress_callback(job.name, snapshot),
+                zip_progress_callback=lambda *args: self.zip_progress_callback(job.name, *args),
+                finished_callback=lambda message: self.finished_callback(job.name, message),
+                error_callback=lambda message: self.error_callback(job.name, message),
+                **job.options)
+            if self.abort_flag:
+                job.engine.abort()
+            job.engine.run()
+            job.status = job.engine.status
+        except Exception as e:
+            # Invalid options of one job don't stop the others
+            job.status = "failed"
+            self.error_callback(job.name, str(e))
+        finally:
+            job.seconds = time.monotonic() - job.started
+            with self.condition:
+                self.running[job.uri] -= 1
+                self.condition.notify_all()
+
+    def summary(self):
+        return {
+            "status": self.status,
+            "seconds": round(self.seconds, 3),
+            "jobs": [job.summary() for job in self.jobs],
+        }
+
+    def abort(self):
+        with self.condition:
+            self.abort_flag = True
+            for job in self.jobs:
+                if job.engine is not None:
+                    job.engine.abort()
+            self.condition.notify_all()
@@ -1,14 +1,57 @@
+import multiprocessing
 import sys
-from PyQt5.QtWidgets import QApplication
-from ui import MongoDBExporter
+
+
+def option_value(name, default):
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
 
 
 def main():
+    # --startup-profile: time the start up to the first painted window, report it and exit,
+    # with status 1 when it took longer than --startup-budget seconds
+    timer = None
+    if "--startup-profile" in sys.argv:
+        from startup import StartupTimer, STARTUP_BUDGET
+        timer = StartupTimer()
+
+    # Imported here so serializer processes, which re-import this module, never load Qt
+    from PyQt5.QtWidgets import QApplication
+    if timer:
+        timer.mark("Qt imported")
+    from ui import MongoDBExporter
+    if timer:
+        timer.mark("ui imported")
+
     app = QApplication(sys.argv)
     window = MongoDBExporter()
+    if timer:
+        timer.mark("window built")
     window.show()
+
+    if timer:
+        from PyQt5.QtCore import QTimer
+        budget = float(option_value("--startup-budget", STARTUP_BUDGET))
+
+        def finish_profile():
+            timer.mark("first paint")
+            timer.stop()
+            report = f"{timer.report()}\nBudget: {budget:.3f} s - {'ok' if timer.elapsed <= budget else 'EXCEEDED'}"
+            if sys.stdout is None:
+                # Windowed builds have no console
+                with open("startup-profile.txt", "w") as file:
+                    file.write(report + "\n")
+            else:
+                print(report, flush=True)
+            app.exit(0 if timer.elapsed <= budget else 1)
+
+        # Runs once the event loop has processed the show and first paint events
+        QTimer.singleShot(0, finish_profile)
+
     sys.exit(app.exec_())
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
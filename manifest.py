@@ -0,0 +1,101 @@
+import datetime
+import hashlib
+import json
+import os
+
+
+# Written into the dated export folder just before it is zipped
+MANIFEST_FILE = "manifest.json"
+
+HASH_NAME = "blake2b"
+DIGEST_SIZE = 32
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def new_hash():
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+
+def hash_stream(stream, limit=None, digest=None):
+    """ (bytes read, hash) of a binary stream, reading at most limit bytes """
+    digest = digest or new_hash()
+    size = 0
+    while limit is None or size < limit:
+        chunk = stream.read(CHUNK_SIZE if limit is None else min(CHUNK_SIZE, limit - size))
+        if not chunk:
+            break
+        # hashlib releases the GIL on large updates, so files are hashed in parallel by threads
+        digest.update(chunk)
+        size += len(chunk)
+    return size, digest
+
+
+def hash_file(file_path):
+    with open(file_path, "rb") as file:
+        size, digest = hash_stream(file)
+    return size, digest.hexdigest()
+
+
+def file_entry(file_path, size, digest, documents=None):
+    entry = {"path": file_path, "bytes": size, HASH_NAME: digest}
+    if documents is not None:
+        entry["documents"] = documents
+    return entry
+
+
+class HashingFile:
+    """Binary file whose written bytes are hashed and counted on their way to disk.
+
+    Compressors write through it, so the hash covers the bytes actually
+    stored and no second read of the file is needed.
+    """
+
+    def __init__(self, file, size=0, digest=None):
+        self.file = file
+        self.size = size
+        self.hash = digest or new_hash()
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def write_manifest(export_dir, db_name, collections):
+    """ Write manifest.json from the entries hashed while the collections were written
+
+    collections maps each collection name to its file entries. Everything
+    else in the folder (BSON metadata, offset indexes, watermarks) is small
+    and hashed here.
+    """
+    files = {}
+    summary = {}
+    for collection_name, entries in collections.items():
+        summary[collection_name] = {
+            "documents": sum(entry.get("documents", 0) for entry in entries),
+            "bytes": sum(entry["bytes"] for entry in entries),
+            "files": [entry["path"] for entry in entries],
+        }
+        for entry in entries:
+            files[entry["path"]] = {key: value for key, value in entry.items() if key != "path"}
+
+    for root, _, names in os.walk(export_dir):
+        for name in names:
+            path = os.path.relpath(os.path.join(root, name), export_dir).replace(os.sep, "/")
+            if path != MANIFEST_FILE and path not in files:
+                size, digest = hash_file(os.path.join(root, name))
+                files[path] = {"bytes": size, HASH_NAME: digest}
+
+    manifest = {
+        "db_name": db_name,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "hash": f"{HASH_NAME}-{DIGEST_SIZE * 8}",
+        "collections": summary,
+        "files": dict(sorted(files.items())),
+    }
+    with open(os.path.join(export_dir, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=4)
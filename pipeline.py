@@ -0,0 +1,157 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from bson import decode_all
+from bson.json_util import dumps
+
+from defaults import DEFAULT_MEMORY_LIMIT_MB
+from rolling import line_ends
+from serializers import NDJSONEncoder
+
+
+# Raw batches waiting per output file between the reader and its writer
+PIPELINE_QUEUE_DEPTH = 4
+
+# Memory charged per raw batch: the BSON bytes plus the encoded text, estimated at twice their size
+BATCH_MEMORY_FACTOR = 3
+
+_encoders = {}
+
+
+def encode_raw_batch(batch, canonical, pretty, boundaries=False):
+    """ Serializer process entry point: raw BSON batch in, encoded bytes out
+
+    With boundaries, the end offset and _id of every document come back too,
+    so an indexed writer can cut the batch into blocks and capped files.
+    """
+    documents = decode_all(batch)
+    ends = None
+    if pretty:
+        encoded = [(dumps(document, indent=4) + "\n").encode() for document in documents]
+        data = b"".join(encoded)
+        if boundaries:
+            ends = list(itertools.accumulate(len(text) for text in encoded))
+    else:
+        if canonical not in _encoders:
+            _encoders[canonical] = NDJSONEncoder(canonical=canonical)
+        data = _encoders[canonical].encode_batch(documents)
+        if boundaries:
+            ends = line_ends(data)
+    first_id = documents[0].get("_id") if documents else None
+    last_id = documents[-1].get("_id") if documents else None
+    ids = [document.get("_id") for document in documents] if boundaries else None
+    return data, len(documents), first_id, last_id, ends, ids
+
+
+class MemoryBudget:
+    """Bytes of batch data allowed in flight across every reader, serializer and writer."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size):
+        with self.condition:
+            # A batch bigger than the whole budget still goes through, alone, instead of blocking forever
+            while self.used and self.used + size > self.limit:
+                self.condition.wait()
+            self.used += size
+
+    def release(self, size):
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+
+class SerializationPipeline:
+    """Cursor reader -> serializer processes -> writer thread, with backpressure.
+
+    The reader blocks on the memory budget and on each file's bounded queue,
+    so a slow disk or slow serializers never let batches pile up in memory.
+    """
+
+    def __init__(self, processes, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, canonical=False, pretty=False,
+                 queue_depth=PIPELINE_QUEUE_DEPTH, boundaries=False):
+        # spawn, never fork: the exporter already runs pymongo and progress threads
+        self.pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+        self.budget = MemoryBudget(memory_limit_mb * 1024 * 1024)
+        self.canonical = canonical
+        self.pretty = pretty
+        # Writers are RollingWriters that need each document's end offset and _id
+        self.boundaries = boundaries
+        self.queue_depth = queue_depth
+        self.lock = threading.Lock()
+        self.serializing = 0
+        self.writing = 0
+
+    def stage_stats(self):
+        with self.lock:
+            return {
+                "serializing": self.serializing,
+                "writing": self.writing,
+                "memory_used": self.budget.used,
+                "memory_limit": self.budget.limit,
+            }
+
+    def run(self, cursor, file, part, counter, abort_check):
+        """ Export one cursor into file; returns the last _id written """
+        pending = queue.Queue(maxsize=self.queue_depth)
+        result = {"last_id": part.last_id, "error": None}
+        writer = threading.Thread(target=self.write, args=(pending, file, part, counter, result))
+        writer.start()
+        try:
+            for batch in cursor:
+                if abort_check() or result["error"]:
+                    break
+                size = len(batch) * BATCH_MEMORY_FACTOR
+                self.budget.acquire(size)
+                with self.lock:
+                    self.serializing += 1
+                future = self.pool.submit(encode_raw_batch, batch, self.canonical, self.pretty, self.boundaries)
+                future.add_done_callback(self.serialized)
+                pending.put((future, size))
+        finally:
+            pending.put(None)
+            writer.join()
+
+        if result["error"]:
+            raise result["error"]
+        return result["last_id"]
+
+    def serialized(self, future):
+        with self.lock:
+            self.serializing -= 1
+            self.writing += 1
+
+    def write(self, pending, file, part, counter, result):
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            future, size = item
+            try:
+                # Once something failed the rest is only drained so its memory is released
+                if not result["error"]:
+                    data, count, first_id, last_id, ends, ids = future.result()
+                    if ends is not None:
+                        file.write_documents(data, ends, ids.__getitem__)
+                    else:
+                        file.write(data, first_id, last_id, count)
+                    counter.add(count, len(data))
+                    if count:
+                        result["last_id"] = last_id
+                    if part.due():
+                        part.save(result["last_id"], file.checkpoint(), file.documents)
+            except Exception as e:
+                result["error"] = e
+            finally:
+                with self.lock:
+                    self.writing -= 1
+                self.budget.release(size)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
@@ -0,0 +1,161 @@
+import threading
+import time
+
+
+# How often the reporter aggregates counters and emits progress
+PROGRESS_INTERVAL = 0.25
+
+
+class ProgressCounter:
+    """Documents and bytes written by a single worker.
+
+    Only the owning worker writes to a counter, so the hot loop never takes a
+    lock; the reporter just reads whatever values are current.
+    """
+
+    __slots__ = ("documents", "bytes")
+
+    def __init__(self):
+        self.documents = 0
+        self.bytes = 0
+
+    def add(self, documents, byte_count):
+        self.documents += documents
+        self.bytes += byte_count
+
+
+class CollectionStats:
+    def __init__(self, name, total, documents, byte_count, documents_per_second, bytes_per_second, state,
+                 measure="documents"):
+        self.name = name
+        self.total = total
+        self.documents = documents
+        self.bytes = byte_count
+        self.documents_per_second = documents_per_second
+        self.bytes_per_second = bytes_per_second
+        self.state = state
+        self.measure = measure
+
+    @property
+    def done(self):
+        return self.bytes if self.measure == "bytes" else self.documents
+
+    @property
+    def percentage(self):
+        return min(self.done / self.total * 100, 100.0) if self.total else 0.0
+
+
+class ProgressSnapshot:
+    def __init__(self, collections, current, documents_per_second, bytes_per_second, elapsed, stages=None,
+                 measure="documents"):
+        self.collections = collections
+        self.current = current
+        self.documents_per_second = documents_per_second
+        self.bytes_per_second = bytes_per_second
+        self.elapsed = elapsed
+        # Queue depths and memory in use of the serialization pipeline, empty when it isn't running
+        self.stages = stages or {}
+        self.total = sum(stats.total for stats in collections.values())
+        self.documents = sum(stats.documents for stats in collections.values())
+        self.bytes = sum(stats.bytes for stats in collections.values())
+        self.measure = measure
+
+    @property
+    def done(self):
+        return self.bytes if self.measure == "bytes" else self.documents
+
+    @property
+    def percentage(self):
+        return min(self.done / self.total * 100, 100.0) if self.total else 0.0
+
+    @property
+    def eta(self):
+        # Seconds left at the average rate so far, -1 while it can't be estimated yet
+        if not self.done or not self.elapsed:
+            return -1.0
+        return max(self.total - self.done, 0) / (self.done / self.elapsed)
+
+
+class ProgressTracker:
+    """Totals and counters per collection; measure says whether totals count documents or bytes."""
+
+    def __init__(self, measure="documents"):
+        self.measure = measure
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.totals = {}
+        self.counters = {}
+        self.states = {}
+        self.previous = {}
+        self.previous_time = self.start_time
+        self.current = None
+        self.stage_stats = None
+
+    def set_total(self, collection_name, total):
+        with self.lock:
+            self.totals[collection_name] = total
+            self.counters.setdefault(collection_name, [])
+
+    def counter(self, collection_name):
+        # Registered once per cursor, never per document
+        counter = ProgressCounter()
+        with self.lock:
+            self.counters.setdefault(collection_name, []).append(counter)
+        return counter
+
+    def set_state(self, collection_name, state):
+        with self.lock:
+            self.states[collection_name] = state
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            interval = max(now - self.previous_time, 1e-9)
+            collections = {}
+            busiest = None
+            busiest_delta = 0
+            # Collections finished or failed before their first batch have a state but no counter
+            names = list(self.counters) + [name for name in self.states if name not in self.counters]
+            for name in names:
+                counters = self.counters.get(name, ())
+                documents = sum(counter.documents for counter in counters)
+                byte_count = sum(counter.bytes for counter in counters)
+                previous_documents, previous_bytes = self.previous.get(name, (0, 0))
+                delta = documents - previous_documents
+                collections[name] = CollectionStats(name, self.totals.get(name, 0), documents, byte_count,
+                                                    delta / interval, (byte_count - previous_bytes) / interval,
+                                                    self.states.get(name, "queued"), self.measure)
+                self.previous[name] = (documents, byte_count)
+                if delta > busiest_delta:
+                    busiest, busiest_delta = name, delta
+            self.previous_time = now
+            # Report the collection that moved most this tick, or stick with the last one
+            self.current = busiest or self.current
+            current = self.current
+
+        documents_per_second = sum(stats.documents_per_second for stats in collections.values())
+        bytes_per_second = sum(stats.bytes_per_second for stats in collections.values())
+        stages = self.stage_stats() if self.stage_stats else None
+        return ProgressSnapshot(collections, current, documents_per_second, bytes_per_second, now - self.start_time,
+                                stages, self.measure)
+
+
+class ProgressReporter(threading.Thread):
+    """Aggregate a tracker off the hot path and hand each snapshot to callback."""
+
+    def __init__(self, tracker, callback, interval=PROGRESS_INTERVAL):
+        super().__init__(daemon=True)
+        self.tracker = tracker
+        self.callback = callback
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.callback(self.tracker.snapshot())
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        # One last report so the final counts are never lost between ticks
+        self.callback(self.tracker.snapshot())
@@ -0,0 +1,113 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+from utils import format_bytes
+
+
+COLUMNS = ("Collection", "State", "Progress", "Documents", "Bytes", "Docs/s", "Bytes/s")
+
+# Milliseconds between table refreshes; snapshots arriving in between are coalesced into the newest
+PROGRESS_REFRESH_MS = 250
+
+
+class ProgressTableModel(QAbstractTableModel):
+    """One row per collection of the running export or restore, updated in place from ProgressSnapshots.
+
+    Each update() costs at most one row insert, one re-sort and a single
+    dataChanged for the whole table, however many collections move at once;
+    the view then only asks for the cells it shows. Sorting is done here
+    rather than in a QSortFilterProxyModel, which re-sorts row by row on
+    every change.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.names = []
+        self.stats = {}
+        self.sort_column = None
+        self.sort_order = Qt.AscendingOrder
+
+    def clear(self):
+        self.beginResetModel()
+        self.names = []
+        self.stats = {}
+        self.endResetModel()
+
+    def update(self, snapshot):
+        new_names = [name for name in snapshot.collections if name not in self.stats]
+        self.stats = snapshot.collections
+        if new_names:
+            self.beginInsertRows(QModelIndex(), len(self.names), len(self.names) + len(new_names) - 1)
+            self.names.extend(new_names)
+            self.endInsertRows()
+        if self.sort_column is not None:
+            self.sort_rows()
+        if self.names:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.names) - 1, len(COLUMNS) - 1))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.names)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        name = self.names[index.row()]
+        stats = self.stats.get(name)
+        column = index.column()
+        if role == Qt.DisplayRole:
+            return self.display(name, stats, column)
+        if role == Qt.TextAlignmentRole and column >= 2:
+            return Qt.AlignRight | Qt.AlignVCenter
+        return None
+
+    def display(self, name, stats, column):
+        if column == 0:
+            return name
+        if stats is None:
+            return ""
+        if column == 1:
+            return stats.state
+        if column == 2:
+            return f"{stats.percentage:.1f}%" if stats.total else ""
+        if column == 3:
+            if stats.measure == "documents" and stats.total:
+                return f"{stats.documents:,} / {stats.total:,}"
+            return f"{stats.documents:,}"
+        if column == 4:
+            if stats.measure == "bytes" and stats.total:
+                return f"{format_bytes(stats.bytes)} / {format_bytes(stats.total)}"
+            return format_bytes(stats.bytes)
+        if column == 5:
+            return f"{stats.documents_per_second:,.0f}"
+        return f"{format_bytes(stats.bytes_per_second)}/s"
+
+    def sort_key(self, name):
+        if self.sort_column == 0:
+            return name
+        stats = self.stats[name]
+        return (stats.state, stats.percentage, stats.documents, stats.bytes, stats.documents_per_second,
+                stats.bytes_per_second)[self.sort_column - 1]
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column if 0 <= column < len(COLUMNS) else None
+        self.sort_order = order
+        if self.sort_column is not None:
+            self.sort_rows()
+
+    def sort_rows(self):
+        self.layoutAboutToBeChanged.emit()
+        old_names = list(self.names)
+        self.names.sort(key=self.sort_key, reverse=self.sort_order == Qt.DescendingOrder)
+        # Keep the view's selection and current cell on the same collections
+        rows = {name: row for row, name in enumerate(self.names)}
+        moved = self.persistentIndexList()
+        self.changePersistentIndexList(moved, [self.index(rows[old_names[index.row()]], index.column())
+                                               for index in moved])
+        self.layoutChanged.emit()
@@ -0,0 +1,453 @@
+import io
+import json
+import os
+import re
+import struct
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import MongoClient, IndexModel
+from pymongo.errors import BulkWriteError, CollectionInvalid
+from bson import decode
+from bson.raw_bson import RawBSONDocument
+from bson.json_util import loads
+
+from change_stream import CHANGES_DIR
+from compression import check_compression, open_decompressed, COMPRESSION_SUFFIXES
+from defaults import CHECKPOINT_FILE, CHECKPOINT_DIR
+from export_engine import DEFAULT_MAX_WORKERS, match_collections, ignore
+from manifest import hash_stream, HASH_NAME, MANIFEST_FILE
+from progress import ProgressTracker, ProgressReporter
+from watermarks import CHAIN_FILE
+
+
+# Formats the exporter writes that can be loaded back
+RESTORE_FORMATS = ("ndjson", "json", "bson")
+
+# Documents per unordered insert_many
+INSERT_BATCH_SIZE = 1000
+
+# insert_many calls each collection keeps running while it reads the next batch
+INSERTS_IN_FLIGHT = 4
+
+# Partition parts (.part-PPPP), rolled files (.part-NNNN) or rolled files of a partition (.part-PPPP-NNNN)
+PART_SUFFIX = re.compile(r"\.part-\d{4}(-\d{4})?$")
+
+# Bookkeeping files the exporter writes next to the data, never collections
+EXPORT_SIDECAR_FILES = (MANIFEST_FILE, CHAIN_FILE, CHECKPOINT_FILE)
+
+# Index fields that describe the index itself rather than options create_indexes accepts
+INDEX_INFO_FIELDS = ("v", "key", "ns")
+
+
+def parse_export_name(name):
+    """ (format, compression, stem) of an exported data file, None for anything else """
+    if name in EXPORT_SIDECAR_FILES or name.startswith((f"{CHANGES_DIR}/", f"{CHECKPOINT_DIR}/")):
+        # Change events written by follow mode and per-collection checkpoints are not collections either
+        return None
+    base = os.path.basename(name)
+    compression = "none"
+    for candidate, suffix in COMPRESSION_SUFFIXES.items():
+        if suffix and base.endswith(suffix):
+            compression = candidate
+            base = base[:-len(suffix)]
+    stem, extension = os.path.splitext(base)
+    output_format = extension[1:]
+    if output_format not in RESTORE_FORMATS or stem.endswith(".metadata"):
+        return None
+    return output_format, compression, PART_SUFFIX.sub("", stem)
+
+
+def collect_collections(names, source_db, manifest=None):
+    """ Data files (in part order) and mongorestore metadata file of every exported collection
+
+    With the export's manifest, only the files it lists for a collection are
+    data; older exports are recognised by their file names.
+    """
+    names = sorted(names)
+    available = set(names)
+    listed = None
+    if manifest is not None:
+        listed = {file_name: collection_name for collection_name, summary in manifest["collections"].items()
+                  for file_name in summary["files"]}
+    collections = {}
+    metadata = {}
+    for name in names:
+        parsed = parse_export_name(name)
+        if parsed is None or (listed is not None and name not in listed):
+            continue
+        output_format, compression, stem = parsed
+        if listed is not None:
+            collection_name = listed[name]
+        elif output_format == "bson":
+            # <db>/<collection>.bson
+            collection_name = stem
+        else:
+            # <db>_<collection>.<format>; without the source database name, the first "_" ends it
+            prefix = f"{source_db}_"
+            collection_name = stem[len(prefix):] if stem.startswith(prefix) else stem.split("_", 1)[-1]
+        if output_format == "bson":
+            # mongorestore layout: <collection>.metadata.json next to the data file
+            metadata_name = name[:-len(os.path.basename(name))] + f"{stem}.metadata.json"
+            metadata_name += COMPRESSION_SUFFIXES[compression]
+            if metadata_name in available:
+                metadata[collection_name] = (metadata_name, compression)
+        collections.setdefault(collection_name, []).append((name, output_format, compression))
+    return collections, metadata
+
+
+def read_documents(stream, output_format):
+    if output_format == "bson":
+        # Raw documents go to the server as they are, without being decoded
+        while True:
+            header = stream.read(4)
+            if not header:
+                return
+            body = stream.read(struct.unpack("<i", header)[0] - 4)
+            yield RawBSONDocument(header + body)
+    elif output_format == "ndjson":
+        for line in stream:
+            if line.strip():
+                yield loads(line)
+    else:
+        # Pretty-printed documents start and end at column 0, everything inside is indented
+        lines = []
+        for line in stream:
+            lines.append(line)
+            if line.rstrip() == b"}":
+                yield loads(b"".join(lines))
+                lines = []
+
+
+def index_models(metadata):
+    return [IndexModel(list(index["key"].items()),
+                       **{key: value for key, value in index.items() if key not in INDEX_INFO_FIELDS})
+            for index in metadata.get("indexes", []) if index["name"] != "_id_"]
+
+
+class CountingReader(io.RawIOBase):
+    """Count the bytes read from a source file, before any decompression."""
+
+    def __init__(self, file):
+        self.file = file
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.file.read(len(buffer))
+        buffer[:len(data)] = data
+        self.count += len(data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class ExportSource:
+    """A dated export folder, or its zip, read file by file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path) if os.path.isfile(path) else None
+
+    def names(self):
+        if self.zip:
+            return [info.filename for info in self.zip.infolist() if not info.is_dir()]
+        return [os.path.relpath(os.path.join(root, file), self.path).replace(os.sep, "/")
+                for root, _, files in os.walk(self.path) for file in files]
+
+    def size(self, name):
+        if self.zip:
+            return self.zip.getinfo(name).file_size
+        return os.path.getsize(os.path.join(self.path, name))
+
+    def open(self, name):
+        if self.zip:
+            return self.zip.open(name)
+        return open(os.path.join(self.path, name), "rb")
+
+    def close(self):
+        if self.zip:
+            self.zip.close()
+
+
+def verify_export(path, max_workers=DEFAULT_MAX_WORKERS, error_callback=ignore):
+    """ Check every file of an export folder or zip against its manifest.json, hashing files in parallel """
+    source = ExportSource(path)
+    try:
+        with source.open(MANIFEST_FILE) as file:
+            manifest = json.load(file)
+        expected = manifest["files"]
+        present = set(source.names()) - {MANIFEST_FILE}
+        missing = sorted(set(expected) - present)
+        unexpected = sorted(present - set(expected))
+        for name in missing:
+            error_callback(f"{name}: missing")
+
+        def check(name):
+            try:
+                with source.open(name) as file:
+                    size, digest = hash_stream(file)
+            except Exception as e:
+                # A corrupted zip member fails its CRC check while it is read
+                return f"{name}: {e}"
+            if size != expected[name]["bytes"]:
+                return f"{name}: {size} bytes, manifest has {expected[name]['bytes']}"
+            if digest.hexdigest() != expected[name][HASH_NAME]:
+                return f"{name}: {HASH_NAME} hash differs from the manifest"
+            return None
+
+        names = sorted(present & set(expected), key=lambda name: expected[name]["bytes"], reverse=True)
+        with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+            corrupted = [message for message in executor.map(check, names) if message]
+        for message in corrupted:
+            error_callback(message)
+    finally:
+        source.close()
+
+    return {
+        "status": "failed" if missing or corrupted else "completed",
+        "files": len(names),
+        "bytes": sum(expected[name]["bytes"] for name in names),
+        "documents": sum(collection["documents"] for collection in manifest["collections"].values()),
+        "missing": missing,
+        "corrupted": corrupted,
+        "unexpected": unexpected,
+    }
+
+
+class RestoreEngine:
+    """Load an export folder or zip back into a database without any GUI dependency.
+
+    Collections are restored in parallel; each streams its files and keeps
+    several unordered insert_many batches running. Progress is measured in
+    bytes of the exported files, so percentages and ETA work without
+    counting documents first. After run() returns, status is one of
+    "completed", "partial", "empty", "aborted" or "failed".
+    """
+
+    def __init__(self, source, uri, db_name, source_db=None, max_workers=DEFAULT_MAX_WORKERS,
+                 batch_size=INSERT_BATCH_SIZE, inserts_in_flight=INSERTS_IN_FLIGHT, drop=False,
+                 rebuild_indexes=False, include=None, exclude=None, max_pool_size=None, progress_callback=ignore,
+                 finished_callback=ignore, error_callback=ignore):
+        self.source = source
+        self.uri = uri
+        self.db_name = db_name
+        self.source_db = source_db or db_name
+        self.max_workers = max(1, int(max_workers))
+        self.batch_size = max(1, int(batch_size))
+        self.inserts_in_flight = max(1, int(inserts_in_flight))
+        self.drop = drop
+        self.rebuild_indexes = rebuild_indexes
+        self.include = include or []
+        self.exclude = exclude or []
+        self.client_options = {"maxPoolSize": int(max_pool_size)} if max_pool_size else {}
+        self.abort_flag = False
+        self.progress = None
+        self.progress_callback = progress_callback
+        self.finished_callback = finished_callback
+        self.error_callback = error_callback
+        self.lock = threading.Lock()
+        self.inserted = 0
+        self.status = None
+        self.errors = []
+
+    def run(self):
+        try:
+            source = ExportSource(self.source)
+            try:
+                names = source.names()
+                manifest = None
+                if MANIFEST_FILE in names:
+                    with source.open(MANIFEST_FILE) as file:
+                        manifest = json.load(file)
+                collections, metadata = collect_collections(names, self.source_db, manifest)
+                names = match_collections(list(collections), self.include, self.exclude)
+                if not names:
+                    self.finish("empty", f"No exported collections found in {self.source}.")
+                    return
+                for files in collections.values():
+                    for _, _, compression in files:
+                        check_compression(compression)
+
+                # Largest collections first, as for the export
+                names.sort(key=lambda name: sum(source.size(file[0]) for file in collections[name]), reverse=True)
+
+                client = MongoClient(self.uri, **self.client_options)
+                db = client[self.db_name]
+
+                self.progress = ProgressTracker(measure="bytes")
+                reporter = ProgressReporter(self.progress, self.progress_callback)
+                reporter.start()
+                try:
+                    workers = min(self.max_workers, len(names))
+                    with ThreadPoolExecutor(max_workers=workers * self.inserts_in_flight) as inserts, \
+                            ThreadPoolExecutor(max_workers=workers) as executor:
+                        futures = [executor.submit(self.restore_collection, db, source, name, collections[name],
+                                                   metadata.get(name), inserts)
+                                   for name in names]
+                        for future in futures:
+                            if self.abort_flag:
+                                for pending in futures:
+                                    pending.cancel()
+                                break
+                            future.result()
+                finally:
+                    reporter.stop()
+                    client.close()
+            finally:
+                source.close()
+
+            if self.abort_flag:
+                self.finish("aborted", "Restore aborted by user.")
+                return
+            self.finish("completed", f"Restore completed successfully! \n "
+                                     f"{self.inserted} documents loaded into {self.db_name}")
+        except Exception as e:
+            self.status = "failed"
+            self.report_error(str(e))
+
+    def restore_collection(self, db, source, collection_name, files, metadata_file, inserts):
+        if self.abort_flag:
+            return
+        try:
+            collection = db[collection_name]
+            metadata = self.read_metadata(source, metadata_file) if metadata_file else {}
+            if self.drop:
+                collection.drop()
+            if metadata.get("options"):
+                # Capped collections, validators and the like have to exist before the first insert
+                try:
+                    db.create_collection(collection_name, **metadata["options"])
+                except CollectionInvalid:
+                    pass
+
+            self.progress.set_total(collection_name, sum(source.size(file[0]) for file in files))
+            self.progress.set_state(collection_name, "restoring")
+            counter = self.progress.counter(collection_name)
+            pending = deque()
+            failed = 0
+
+            for file_name, output_format, compression in files:
+                raw = CountingReader(source.open(file_name))
+                read = 0
+                with raw, open_decompressed(raw, compression) as stream:
+                    batch = []
+                    for document in read_documents(stream, output_format):
+                        batch.append(document)
+                        if len(batch) < self.batch_size:
+                            continue
+                        if self.abort_flag:
+                            break
+                        pending.append(inserts.submit(self.insert_batch, collection, batch))
+                        batch = []
+                        counter.add(0, raw.count - read)
+                        read = raw.count
+                        # Backpressure: wait for the oldest insert before reading further ahead
+                        if len(pending) >= self.inserts_in_flight:
+                            failed += self.collect(pending.popleft(), counter)
+                    if batch and not self.abort_flag:
+                        pending.append(inserts.submit(self.insert_batch, collection, batch))
+                counter.add(0, raw.count - read)
+                if self.abort_flag:
+                    break
+
+            while pending:
+                failed += self.collect(pending.popleft(), counter)
+            if failed:
+                self.report_error(f"{collection_name}: {failed} documents were not inserted (e.g. duplicate _id).")
+
+            if self.abort_flag:
+                self.progress.set_state(collection_name, "aborted")
+                return
+
+            if self.rebuild_indexes:
+                indexes = index_models(metadata)
+                if indexes:
+                    # Built once after the load instead of being maintained for every insert
+                    self.progress.set_state(collection_name, "indexing")
+                    collection.create_indexes(indexes)
+            self.progress.set_state(collection_name, "done")
+        except Exception as e:
+            self.progress.set_state(collection_name, "failed")
+            self.report_error(f"{collection_name}: {e}")
+
+    def read_metadata(self, source, metadata_file):
+        name, compression = metadata_file
+        with source.open(name) as file, open_decompressed(file, compression) as stream:
+            return loads(stream.read())
+
+    def insert_batch(self, collection, documents):
+        """ Returns (inserted, failed); unordered, so one bad document doesn't stop the rest """
+        try:
+            collection.insert_many(documents, ordered=False)
+            return len(documents), 0
+        except BulkWriteError as e:
+            return e.details["nInserted"], len(e.details["writeErrors"])
+
+    def collect(self, future, counter):
+        inserted, failed = future.result()
+        counter.add(inserted, 0)
+        with self.lock:
+            self.inserted += inserted
+        return failed
+
+    def finish(self, status, message):
+        self.status = "partial" if status == "completed" and self.errors else status
+        self.finished_callback(message)
+
+    def report_error(self, message):
+        self.errors.append(message)
+        self.error_callback(message)
+
+    def abort(self):
+        self.abort_flag = True
+
+
+class OffsetIndex:
+    """Read documents of an indexed export by seeking straight to the blocks that hold them."""
+
+    def __init__(self, index_path):
+        self.folder = os.path.dirname(os.path.abspath(index_path))
+        with open(index_path) as file:
+            index = loads(file.read())
+        self.output_format = index["format"]
+        self.compression = index["compression"]
+        check_compression(self.compression)
+        self.files = index["files"]
+        self.blocks = index["blocks"]
+
+    def overlapping(self, lower, upper):
+        for block in self.blocks:
+            try:
+                if block["first"] <= upper and lower <= block["last"]:
+                    yield block
+            except TypeError:
+                # _ids of another BSON type can't be in the range
+                continue
+
+    def read_block(self, block):
+        with open(os.path.join(self.folder, block["file"]), "rb") as raw:
+            raw.seek(block["offset"])
+            with open_decompressed(raw, self.compression) as stream:
+                documents = read_documents(stream, self.output_format)
+                for _ in range(block["count"]):
+                    document = next(documents)
+                    yield decode(document.raw) if self.output_format == "bson" else document
+
+    def extract(self, lower, upper):
+        """ Documents with lower <= _id <= upper, in file order """
+        for block in self.overlapping(lower, upper):
+            for document in self.read_block(block):
+                if lower <= document["_id"] <= upper:
+                    yield document
+
+    def lookup(self, _id):
+        for document in self.extract(_id, _id):
+            if document["_id"] == _id:
+                return document
+        return None
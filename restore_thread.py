@@ -0,0 +1,36 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from restore_engine import RestoreEngine
+
+
+class RestoreThread(QThread):
+    finished = pyqtSignal(str)
+    error_occurred = pyqtSignal(str)
+    # Collections that failed while the rest carry on; error_occurred only for a failure that ends the run
+    collection_error = pyqtSignal(str)
+
+    def __init__(self, source, uri, db_name, **options):
+        super().__init__()
+        # Newest ProgressSnapshot, read by the window's refresh timer instead of being signalled per tick
+        self.snapshot = None
+        self.engine = RestoreEngine(source, uri, db_name,
+                                    progress_callback=self.emit_progress,
+                                    finished_callback=self.finished.emit,
+                                    error_callback=self.report_error,
+                                    **options)
+
+    def run(self):
+        self.engine.run()
+
+    def emit_progress(self, snapshot):
+        self.snapshot = snapshot
+
+    def report_error(self, message):
+        # The engine marks the run failed before reporting the error that ends it
+        if self.engine.status == "failed":
+            self.error_occurred.emit(message)
+        else:
+            self.collection_error.emit(message)
+
+    def abort(self):
+        self.engine.abort()
@@ -0,0 +1,226 @@
+import glob
+import os
+import struct
+
+from bson.json_util import dumps, loads, CANONICAL_JSON_OPTIONS
+
+from compression import CheckpointWriter
+
+
+# Sidecar next to a collection's data files, mapping _id ranges to (file, byte offset)
+INDEX_SUFFIX = ".idx"
+# Block list of one part, kept until the collection's index is written
+BLOCKS_SUFFIX = ".blocks"
+
+# Uncompressed bytes per index block; a lookup decodes at most one block
+INDEX_BLOCK_SIZE = 1024 * 1024
+
+
+def blocks_path(file_path):
+    return file_path + BLOCKS_SUFFIX
+
+
+def line_ends(data):
+    """ End offset of every line of NDJSON data, one document per line """
+    ends = []
+    position = data.find(b"\n")
+    while position != -1:
+        ends.append(position + 1)
+        position = data.find(b"\n", position + 1)
+    return ends
+
+
+def bson_ends(batch):
+    """ End offset of every document of a raw BSON batch, from their length prefixes """
+    ends = []
+    offset = 0
+    while offset < len(batch):
+        offset += struct.unpack_from("<i", batch, offset)[0]
+        ends.append(offset)
+    return ends
+
+
+def write_index(index_path, part_paths, output_format, compression, merged_path=None):
+    """ Combine the block lists of a collection's parts into its index and remove them """
+    files = []
+    blocks = []
+    shift = 0
+    for part_path in part_paths:
+        with open(blocks_path(part_path)) as file:
+            part = loads(file.read())
+        for block in part["blocks"]:
+            if merged_path is not None:
+                # Parts were concatenated, so their blocks moved behind the parts before them
+                block["file"] = os.path.basename(merged_path)
+                block["offset"] += shift
+            blocks.append(block)
+        if merged_path is None:
+            files.extend(part["files"])
+        else:
+            shift += sum(size for _, size in part["files"])
+    if merged_path is not None:
+        files = [[os.path.basename(merged_path), shift]]
+
+    index = {"format": output_format, "compression": compression, "files": files, "blocks": blocks}
+    temp_path = f"{index_path}.tmp"
+    with open(temp_path, "w") as file:
+        file.write(dumps(index, json_options=CANONICAL_JSON_OPTIONS))
+    os.replace(temp_path, index_path)
+    for part_path in part_paths:
+        os.remove(blocks_path(part_path))
+
+
+class RollingWriter:
+    """Write one part as size- or document-capped files while recording an offset index.
+
+    Data is grouped into blocks of about block_size uncompressed bytes. Each
+    block starts on a gzip member or zstd frame boundary, so a reader can seek
+    to its offset and decode it on its own. write_documents() cuts batches at
+    document boundaries, so blocks and capped files end where they should
+    however large the cursor batches are; only compressed files can pass
+    max_size, by up to one block. Without either cap everything goes to
+    file_path itself and only the index is added.
+    """
+
+    def __init__(self, file_path, extension, compression="none", level=None, max_size=None, max_documents=None,
+                 block_size=INDEX_BLOCK_SIZE):
+        self.file_path = file_path
+        self.prefix = file_path[:-len(extension) - 1]
+        self.extension = extension
+        self.compression = compression
+        self.level = level
+        self.max_size = max_size
+        self.max_documents = max_documents
+        self.block_size = block_size
+        self.rolling = bool(max_size or max_documents)
+        self.file = None
+        self.files = []
+        self.entries = []
+        self.blocks = []
+        self.block = None
+        self.block_bytes = 0
+        self.offset = 0
+        self.file_documents = 0
+        self.size = 0
+        # <base>.part-NNNN.<ext>, or <base>.part-PPPP-NNNN.<ext> when the collection is also partitioned
+        self.separator = "-" if ".part-" in os.path.basename(self.prefix) else ".part-"
+        if self.rolling:
+            # A restarted part must not leave files of its earlier attempt behind
+            pattern = glob.escape(self.prefix + self.separator) + "[0-9]" * 4 + glob.escape("." + extension)
+            for stale in glob.glob(pattern):
+                os.remove(stale)
+
+    def roll_path(self, index):
+        if not self.rolling:
+            return self.file_path
+        return f"{self.prefix}{self.separator}{index:04d}.{self.extension}"
+
+    def open_next_file(self):
+        self.close_file()
+        path = self.roll_path(len(self.files))
+        self.files.append(path)
+        self.file = CheckpointWriter(path, self.compression, self.level)
+        self.offset = 0
+        self.file_documents = 0
+
+    def close_file(self):
+        if self.file is None:
+            return
+        self.end_block(checkpoint=False)
+        self.file.close()
+        self.size += self.file.size
+        self.entries.extend(self.file.manifest_entries())
+        self.file = None
+
+    def end_block(self, checkpoint=True):
+        if self.block is None:
+            return
+        self.blocks.append(self.block)
+        self.block = None
+        self.block_bytes = 0
+        if checkpoint:
+            # Ends the gzip member or zstd frame, so the next block can be decoded from its offset
+            self.offset = self.file.checkpoint(sync=False)
+
+    def full(self, size, count):
+        if not self.rolling or not self.file_documents:
+            return False
+        if self.max_documents and self.file_documents + count > self.max_documents:
+            return True
+        if self.max_size:
+            if self.compression == "none":
+                return self.offset + self.block_bytes + size > self.max_size
+            # Compressed sizes are only known at block boundaries
+            return self.block is None and self.offset >= self.max_size
+        return False
+
+    def write(self, data, first_id=None, last_id=None, count=0):
+        if not data:
+            return
+        if self.block_bytes >= self.block_size:
+            self.end_block()
+        if self.file is None or self.full(len(data), count):
+            self.open_next_file()
+        if self.block is None:
+            self.block = {"file": os.path.basename(self.files[-1]), "offset": self.offset, "count": 0,
+                          "first": first_id, "last": last_id}
+        self.file.write(data, first_id, last_id, count)
+        self.block_bytes += len(data)
+        self.block["count"] += count
+        self.block["last"] = last_id
+        self.file_documents += count
+
+    def room(self):
+        """ (bytes, documents) the next write can take before its block ends or its file rolls """
+        size = self.block_size - self.block_bytes if self.block_bytes < self.block_size else self.block_size
+        if self.max_size and self.compression == "none":
+            left = self.max_size - self.offset - self.block_bytes
+            size = min(size, left if left > 0 else self.max_size)
+        documents = None
+        if self.max_documents:
+            left = self.max_documents - self.file_documents
+            documents = left if left > 0 else self.max_documents
+        return size, documents
+
+    def write_documents(self, data, ends, id_at):
+        """ Write a batch of whole documents; ends holds where each one ends in data, id_at(i) its _id """
+        start = 0
+        first = 0
+        while first < len(ends):
+            size, documents = self.room()
+            limit = len(ends) if documents is None else min(len(ends), first + documents)
+            # At least one document, even one larger than the room left
+            last = first
+            while last + 1 < limit and ends[last + 1] - start <= size:
+                last += 1
+            self.write(data[start:ends[last]], id_at(first), id_at(last), last - first + 1)
+            start = ends[last]
+            first = last + 1
+
+    @property
+    def documents(self):
+        return sum(entry["documents"] for entry in self.entries) + (self.file.documents if self.file else 0)
+
+    def checkpoint(self):
+        if self.file is None:
+            return 0
+        return self.file.checkpoint()
+
+    def manifest_entries(self):
+        return self.entries
+
+    def close(self):
+        if self.file is None:
+            # An empty part still leaves its (empty) file behind, like CheckpointWriter does
+            self.open_next_file()
+        self.close_file()
+        files = [[os.path.basename(path), os.path.getsize(path)] for path in self.files]
+        with open(blocks_path(self.file_path), "w") as file:
+            file.write(dumps({"files": files, "blocks": self.blocks}, json_options=CANONICAL_JSON_OPTIONS))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
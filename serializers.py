@@ -0,0 +1,86 @@
+import base64
+import datetime
+import json
+
+from bson import ObjectId, Decimal128, Binary
+from bson.json_util import default, CANONICAL_JSON_OPTIONS, RELAXED_JSON_OPTIONS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class NDJSONEncoder:
+    """Encode documents as compact Extended JSON, one document per line.
+
+    The common BSON types are converted inline; anything rarer is handed to
+    bson.json_util so the output always matches json_util's own encoding.
+    """
+
+    def __init__(self, canonical=False, use_orjson=True):
+        self.canonical = canonical
+        self.json_options = CANONICAL_JSON_OPTIONS if canonical else RELAXED_JSON_OPTIONS
+        self.use_orjson = use_orjson and orjson is not None
+        self.converters = {
+            dict: self.convert_document,
+            list: self.convert_list,
+            str: None,
+            bool: None,
+            type(None): None,
+            ObjectId: lambda value: {"$oid": str(value)},
+            Decimal128: lambda value: {"$numberDecimal": str(value)},
+            Binary: self.convert_binary,
+            bytes: self.convert_binary,
+            datetime.datetime: self.convert_datetime,
+        }
+        if not canonical:
+            # Relaxed mode writes plain numbers; non-finite floats still need $numberDouble
+            self.converters[int] = None
+            self.converters[float] = self.convert_float
+
+    def convert(self, value):
+        try:
+            converter = self.converters[type(value)]
+        except KeyError:
+            try:
+                return default(value, self.json_options)
+            except TypeError:
+                return value
+        return value if converter is None else converter(value)
+
+    def convert_document(self, document):
+        return {key: self.convert(value) for key, value in document.items()}
+
+    def convert_list(self, values):
+        return [self.convert(value) for value in values]
+
+    def convert_float(self, value):
+        if value != value or value in (float("inf"), float("-inf")):
+            return default(value, self.json_options)
+        return value
+
+    def convert_binary(self, value):
+        subtype = getattr(value, "subtype", 0)
+        return {"$binary": {"base64": base64.b64encode(value).decode(), "subType": f"{subtype:02x}"}}
+
+    def convert_datetime(self, value):
+        # Naive datetimes are UTC as returned by pymongo; others keep json_util's handling
+        if self.canonical or value.tzinfo is not None or not 1970 <= value.year <= 9999:
+            return default(value, self.json_options)
+        millis = value.microsecond // 1000
+        fraction = f".{millis:03d}" if millis else ""
+        return {"$date": f"{value.strftime('%Y-%m-%dT%H:%M:%S')}{fraction}Z"}
+
+    def encode(self, document):
+        converted = self.convert_document(document)
+        if self.use_orjson:
+            return orjson.dumps(converted)
+        return json.dumps(converted, separators=(",", ":"), ensure_ascii=False).encode()
+
+    def encode_batch(self, documents):
+        # One buffer per cursor batch so the writer does a single write call
+        lines = [self.encode(document) for document in documents]
+        if not lines:
+            return b""
+        return b"\n".join(lines) + b"\n"
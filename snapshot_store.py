@@ -0,0 +1,340 @@
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from compression import check_compression, zstandard, DEFAULT_COMPRESSION_LEVELS
+from manifest import new_hash, HASH_NAME
+
+
+REPOSITORY_FILE = "repository.json"
+CHUNKS_DIR = "chunks"
+SNAPSHOTS_DIR = "snapshots"
+# A store in progress holds a file here, and garbage collection refuses to run while there are any
+LOCKS_DIR = "locks"
+# Held by a running gc; stores wait for it to go before writing chunks
+GC_LOCK_FILE = "gc"
+# Seconds between checks of a store waiting for gc
+GC_WAIT_INTERVAL = 0.5
+
+# Chunk sizes: cut points are only considered past the minimum, and expected every CHUNK_AVG_SIZE after it
+CHUNK_MIN_SIZE = 256 * 1024
+CHUNK_AVG_SIZE = 1024 * 1024
+CHUNK_MAX_SIZE = 8 * 1024 * 1024
+
+READ_SIZE = 16 * 1024 * 1024
+
+
+def delimiter_for(name):
+    # Pretty-printed documents end with "}" on its own line; cutting only there keeps a document whole
+    # and skips the many short lines inside it
+    return b"\n}\n" if name.endswith(".json") else b"\n"
+
+
+def find_cut(buffer, start, limit, delimiter, min_size=CHUNK_MIN_SIZE, avg_size=CHUNK_AVG_SIZE):
+    """ End of the chunk starting at start, at most limit
+
+    A cut can only follow a delimiter, and whether it does depends only on the
+    bytes since the previous delimiter. Inserting or removing data therefore
+    only moves the cuts around the change, and the chunks after it match the
+    ones stored before.
+    """
+    position = start + min_size
+    if position >= limit:
+        return limit
+    previous = buffer.rfind(delimiter, start, position)
+    segment_start = start if previous < 0 else previous + len(delimiter)
+    # Each segment cuts with a probability of its length / avg_size
+    scale = (1 << 32) // avg_size
+    view = memoryview(buffer)
+    while True:
+        found = buffer.find(delimiter, position, limit)
+        if found < 0:
+            return limit
+        end = found + len(delimiter)
+        if zlib.crc32(view[segment_start:end]) < (end - segment_start) * scale:
+            return end
+        segment_start = position = end
+
+
+def iter_chunks(stream, delimiter=b"\n", min_size=CHUNK_MIN_SIZE, avg_size=CHUNK_AVG_SIZE, max_size=CHUNK_MAX_SIZE):
+    """ Content-defined chunks of a binary stream """
+    buffer = b""
+    start = 0
+    eof = False
+    while True:
+        if not eof and len(buffer) - start < max_size:
+            data = stream.read(READ_SIZE)
+            if data:
+                buffer = buffer[start:] + data
+                start = 0
+                continue
+            eof = True
+        if start >= len(buffer):
+            return
+        end = find_cut(buffer, start, min(len(buffer), start + max_size), delimiter, min_size, avg_size)
+        yield buffer[start:end]
+        start = end
+
+
+class SnapshotRepository:
+    """Deduplicated, content-addressed store of dated export folders.
+
+    Files are split into content-defined chunks that are stored once under
+    their BLAKE2b hash; a snapshot is only the list of chunks of every file.
+    Data that didn't change since an earlier snapshot, of any database, adds
+    nothing but references. Chunks are compressed one by one with the
+    compression the repository was created with.
+    """
+
+    def __init__(self, path, compression="zstd", level=None):
+        self.path = path
+        config_path = os.path.join(path, REPOSITORY_FILE)
+        if os.path.exists(config_path):
+            with open(config_path) as file:
+                config = json.load(file)
+        else:
+            check_compression(compression)
+            config = {
+                "hash": HASH_NAME,
+                "compression": compression,
+                "level": DEFAULT_COMPRESSION_LEVELS[compression] if level is None else level,
+                "chunk_min_size": CHUNK_MIN_SIZE,
+                "chunk_avg_size": CHUNK_AVG_SIZE,
+                "chunk_max_size": CHUNK_MAX_SIZE,
+            }
+            for directory in (CHUNKS_DIR, SNAPSHOTS_DIR, LOCKS_DIR):
+                os.makedirs(os.path.join(path, directory), exist_ok=True)
+            with open(config_path, "w") as file:
+                json.dump(config, file, indent=4)
+        check_compression(config["compression"])
+        self.compression = config["compression"]
+        self.level = config["level"]
+        # Sizes are fixed per repository, other values would cut different chunks and break deduplication
+        self.chunk_sizes = (config["chunk_min_size"], config["chunk_avg_size"], config["chunk_max_size"])
+        self.lock = threading.Lock()
+
+    def chunk_path(self, digest):
+        return os.path.join(self.path, CHUNKS_DIR, digest[:2], digest)
+
+    def snapshot_path(self, db_name, name):
+        return os.path.join(self.path, SNAPSHOTS_DIR, db_name, f"{name}.json")
+
+    def compress(self, data):
+        if self.compression == "gzip":
+            return gzip.compress(data, self.level)
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return data
+
+    def decompress(self, data):
+        if self.compression == "gzip":
+            return gzip.decompress(data)
+        if self.compression == "zstd":
+            return zstandard.ZstdDecompressor().decompress(data)
+        return data
+
+    def put_chunk(self, digest, data):
+        """ Returns the bytes stored, 0 when the chunk was already there """
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            return 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stored = self.compress(data)
+        # Written under a unique name and renamed, so a chunk is either whole or absent
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(stored)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+        return len(stored)
+
+    def get_chunk(self, digest):
+        with open(self.chunk_path(digest), "rb") as file:
+            return self.decompress(file.read())
+
+    def store(self, folder, db_name, name, workers=None, progress_callback=None, abort_check=None):
+        """ Store every file of folder as snapshot name of db_name; returns its stats, None when aborted """
+        abort_check = abort_check or (lambda: False)
+        members = []
+        for root, _, files in os.walk(folder):
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                members.append((file_path, os.path.relpath(file_path, folder).replace(os.sep, "/")))
+        total_bytes = sum(os.path.getsize(file_path) for file_path, _ in members)
+        stats = {"files": len(members), "bytes": 0, "chunks": 0, "new_chunks": 0, "stored_bytes": 0}
+        progress = {"bytes": 0, "percentage": -1}
+
+        def store_file(file_path, arcname):
+            chunks = []
+            file_hash = new_hash()
+            size = 0
+            with open(file_path, "rb") as file:
+                for chunk in iter_chunks(file, delimiter_for(arcname), *self.chunk_sizes):
+                    if abort_check():
+                        return None
+                    digest = new_hash()
+                    digest.update(chunk)
+                    digest = digest.hexdigest()
+                    stored = self.put_chunk(digest, chunk)
+                    file_hash.update(chunk)
+                    size += len(chunk)
+                    chunks.append(digest)
+                    with self.lock:
+                        stats["chunks"] += 1
+                        stats["new_chunks"] += 1 if stored else 0
+                        stats["stored_bytes"] += stored
+                        stats["bytes"] += len(chunk)
+                        progress["bytes"] += len(chunk)
+                        percentage = int(progress["bytes"] * 100 / total_bytes) if total_bytes else 100
+                        report = percentage != progress["percentage"]
+                        progress["percentage"] = percentage
+                    if report and progress_callback:
+                        progress_callback(percentage, arcname)
+            return arcname, {"bytes": size, HASH_NAME: file_hash.hexdigest(), "chunks": chunks}
+
+        lock_path = os.path.join(self.path, LOCKS_DIR, f"store-{uuid.uuid4().hex}")
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        open(lock_path, "w").close()
+        try:
+            # The store lock is taken before looking for gc's, so a gc starting from here on sees it and refuses,
+            # and one already running is waited for: it could delete chunks put_chunk finds present
+            while os.path.exists(os.path.join(self.path, LOCKS_DIR, GC_LOCK_FILE)):
+                if abort_check():
+                    return None
+                time.sleep(GC_WAIT_INTERVAL)
+            # Large files first, so one of them doesn't start last and finish alone
+            members.sort(key=lambda member: os.path.getsize(member[0]), reverse=True)
+            with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+                results = list(executor.map(lambda member: store_file(*member), members))
+            if abort_check() or None in results:
+                return None
+
+            snapshot = {
+                "db_name": db_name,
+                "name": name,
+                "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "bytes": stats["bytes"],
+                "files": dict(sorted(results)),
+            }
+            snapshot_path = self.snapshot_path(db_name, name)
+            os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+            temp_path = f"{snapshot_path}.tmp"
+            with open(temp_path, "w") as file:
+                json.dump(snapshot, file)
+            os.replace(temp_path, snapshot_path)
+        finally:
+            os.remove(lock_path)
+        return stats
+
+    def read_snapshot(self, db_name, name):
+        with open(self.snapshot_path(db_name, name)) as file:
+            return json.load(file)
+
+    def snapshots(self, db_name=None):
+        """ Every snapshot (or those of db_name), oldest first """
+        snapshots_dir = os.path.join(self.path, SNAPSHOTS_DIR)
+        databases = [db_name] if db_name else sorted(os.listdir(snapshots_dir))
+        found = []
+        for database in databases:
+            db_dir = os.path.join(snapshots_dir, database)
+            if not os.path.isdir(db_dir):
+                continue
+            for file_name in os.listdir(db_dir):
+                if file_name.endswith(".json"):
+                    snapshot = self.read_snapshot(database, file_name[:-len(".json")])
+                    found.append({key: snapshot[key] for key in ("db_name", "name", "created", "bytes")})
+        # Folder names are dd-mm-YYYY, so the creation time orders them
+        return sorted(found, key=lambda snapshot: snapshot["created"])
+
+    def restore(self, db_name, name, target_dir, workers=None):
+        """ Write the files of a snapshot back into target_dir, checking each against its hash """
+        snapshot = self.read_snapshot(db_name, name)
+
+        def restore_file(arcname, entry):
+            file_path = os.path.join(target_dir, *arcname.split("/"))
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            file_hash = new_hash()
+            with open(file_path, "wb") as file:
+                for digest in entry["chunks"]:
+                    chunk = self.get_chunk(digest)
+                    file_hash.update(chunk)
+                    file.write(chunk)
+            if file_hash.hexdigest() != entry[HASH_NAME]:
+                raise ValueError(f"{arcname}: restored data doesn't match its {HASH_NAME} hash")
+
+        os.makedirs(target_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = [executor.submit(restore_file, arcname, entry) for arcname, entry in snapshot["files"].items()]
+            for future in futures:
+                future.result()
+        return {"files": len(snapshot["files"]), "bytes": snapshot["bytes"]}
+
+    def prune(self, keep, db_name=None):
+        """ Forget all but the newest keep snapshots of each database; their chunks go with the next gc """
+        by_database = {}
+        for snapshot in self.snapshots(db_name):
+            by_database.setdefault(snapshot["db_name"], []).append(snapshot)
+        removed = []
+        for snapshots in by_database.values():
+            for snapshot in snapshots[:max(0, len(snapshots) - keep)]:
+                os.remove(self.snapshot_path(snapshot["db_name"], snapshot["name"]))
+                removed.append(f"{snapshot['db_name']}/{snapshot['name']}")
+        return removed
+
+    def gc(self):
+        """ Delete every chunk no snapshot references """
+        locks_dir = os.path.join(self.path, LOCKS_DIR)
+        gc_lock_path = os.path.join(locks_dir, GC_LOCK_FILE)
+        os.makedirs(locks_dir, exist_ok=True)
+        try:
+            os.close(os.open(gc_lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            raise ValueError(f"Another gc is running on {self.path} "
+                             f"(or remove {LOCKS_DIR}/{GC_LOCK_FILE} left by a crashed one)") from None
+        try:
+            # Checked only after taking the gc lock: a store starting later waits for it to go
+            if any(file_name != GC_LOCK_FILE for file_name in os.listdir(locks_dir)):
+                raise ValueError(f"Snapshots are being stored into {self.path}; run gc once they finish "
+                                 f"(or remove stale files in {LOCKS_DIR}/ left by a crashed export)")
+            return self.collect_garbage()
+        finally:
+            os.remove(gc_lock_path)
+
+    def collect_garbage(self):
+        referenced = set()
+        for snapshot in self.snapshots():
+            for entry in self.read_snapshot(snapshot["db_name"], snapshot["name"])["files"].values():
+                referenced.update(entry["chunks"])
+
+        removed = 0
+        freed = 0
+        kept = 0
+        chunks_dir = os.path.join(self.path, CHUNKS_DIR)
+        for root, _, files in os.walk(chunks_dir):
+            for file_name in files:
+                if file_name in referenced:
+                    kept += 1
+                    continue
+                file_path = os.path.join(root, file_name)
+                freed += os.path.getsize(file_path)
+                os.remove(file_path)
+                removed += 1
+        return {"removed": removed, "freed_bytes": freed, "kept": kept}
+
+    def stats(self):
+        """ Logical size of every snapshot against the bytes the chunks take on disk """
+        chunks = 0
+        stored = 0
+        for root, _, files in os.walk(os.path.join(self.path, CHUNKS_DIR)):
+            chunks += len(files)
+            stored += sum(os.path.getsize(os.path.join(root, file_name)) for file_name in files)
+        snapshots = self.snapshots()
+        return {"snapshots": len(snapshots), "bytes": sum(snapshot["bytes"] for snapshot in snapshots),
+                "chunks": chunks, "stored_bytes": stored}
@@ -0,0 +1,73 @@
+import builtins
+import sys
+import threading
+import time
+
+
+# Seconds from main.py starting to the first painted window that --startup-profile accepts
+STARTUP_BUDGET = 1.5
+
+# Packages listed in the import breakdown, slowest first
+REPORT_IMPORTS = 15
+
+
+class StartupTimer:
+    """Milestones and an import-time breakdown of a GUI start, for main.py --startup-profile.
+
+    While active, __import__ is wrapped so every module first imported on the
+    main thread is timed, both on its own and including the modules it pulls
+    in. Unlike python -X importtime it also works in the PyInstaller build.
+    Time spent before main.py runs (interpreter start, unpacking a one-file
+    build) is not measured.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.milestones = []
+        # Module name -> (seconds including nested imports, seconds of its own)
+        self.imports = {}
+        self.nested = []
+        self.thread = threading.get_ident()
+        self.original_import = builtins.__import__
+        builtins.__import__ = self.timed_import
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules or threading.get_ident() != self.thread:
+            return self.original_import(name, globals, locals, fromlist, level)
+        started = time.perf_counter()
+        self.nested.append(0.0)
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+            self.imports[name] = (elapsed, elapsed - nested)
+
+    def mark(self, milestone):
+        self.milestones.append((milestone, time.perf_counter() - self.start))
+
+    def stop(self):
+        builtins.__import__ = self.original_import
+
+    @property
+    def elapsed(self):
+        return self.milestones[-1][1] if self.milestones else 0.0
+
+    def report(self):
+        lines = ["Startup milestones (seconds since main.py started):"]
+        previous = 0.0
+        for milestone, at in self.milestones:
+            lines.append(f"  {at:8.3f}  (+{at - previous:.3f})  {milestone}")
+            previous = at
+
+        packages = {}
+        for name, (_, own) in self.imports.items():
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0.0) + own
+        lines.append(f"Import time by package ({len(self.imports)} modules, "
+                     f"{sum(packages.values()):.3f} s in total):")
+        for package, seconds in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:REPORT_IMPORTS]:
+            lines.append(f"  {seconds:8.3f}  {package}")
+        return "\n".join(lines)
@@ -1,16 +1,42 @@
-import json
+import functools
+import os
 
 from PyQt5.QtWidgets import (
     QMainWindow, QLabel, QLineEdit, QPushButton, QVBoxLayout,
-    QHBoxLayout, QWidget, QFileDialog, QMessageBox, QProgressBar, QGraphicsOpacityEffect, QAction, QDialog
+    QHBoxLayout, QWidget, QFileDialog, QMessageBox, QProgressBar, QGraphicsOpacityEffect, QAction, QDialog,
+    QSpinBox, QCheckBox, QComboBox, QTableView, QHeaderView, QAbstractItemView
 )
 from PyQt5.QtGui import QFont, QPixmap, QIcon
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import Qt, QTimer
 
-from export_thread import ExportThread
-from updater import UpdateThread
-from utils import resource_path
+# pymongo, bson and requests are imported where an export, restore, script or update check first needs them,
+# so the window shows without waiting for them
+from defaults import (
+    DEFAULT_MAX_WORKERS, OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT, BATCH_SIZE, READ_PREFERENCES, WIRE_COMPRESSORS,
+    CHECKPOINT_FILE, DEFAULT_MEMORY_LIMIT_MB, DEFAULT_ROLL_SIZE_MB, DEFAULT_FLUSH_INTERVAL
+)
+from archive import ZIP_METHODS, ZIP_LEVELS, DEFAULT_ZIP_LEVELS
+from compression import COMPRESSIONS, COMPRESSION_LEVELS, DEFAULT_COMPRESSION_LEVELS
+from progress_model import ProgressTableModel, PROGRESS_REFRESH_MS
+from utils import resource_path, format_bytes, format_duration
+
+
+# Collection errors listed in the message at the end of a run; the table shows every failed collection
+SUMMARY_ERRORS = 10
+
+
+@functools.lru_cache(maxsize=None)
+def load_pixmap(name, size=None):
+    """ Asset decoded and scaled once, then shared by every window and dialog that shows it """
+    pixmap = QPixmap(resource_path(f"./asset/{name}"))
+    if size is None:
+        return pixmap
+    return pixmap.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+
+@functools.lru_cache(maxsize=None)
+def load_icon(name):
+    return QIcon(load_pixmap(name))
 
 
 class AboutDialog(QDialog):
@@ -22,12 +48,11 @@ class AboutDialog(QDialog):
         layout = QVBoxLayout()
 
         # Set window icon (favicon)
-        self.setWindowIcon(QIcon(resource_path("./asset/favicon.png")))  # Provide the path to your favicon file
+        self.setWindowIcon(load_icon("favicon.png"))
 
         # Logo
         logo_label = QLabel(self)
-        pixmap = QPixmap(resource_path("./asset/mongo_icon.png"))
-        logo_label.setPixmap(pixmap.scaled(64, 64, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        logo_label.setPixmap(load_pixmap("mongo_icon.png", 64))
         logo_label.setAlignment(Qt.AlignCenter)
 
         # Application name and version
@@ -35,14 +60,13 @@ class AboutDialog(QDialog):
         app_name_label.setFont(QFont('Roboto', 18, QFont.Bold))
         app_name_label.setAlignment(Qt.AlignCenter)
 
-        version_label = QLabel("Version 2.3.0", self)
+        version_label = QLabel("Version 2.4.0", self)
         version_label.setFont(QFont('Roboto', 12))
         version_label.setAlignment(Qt.AlignCenter)
 
         # Developer image
         dev_image_label = QLabel(self)
-        dev_image_pixmap = QPixmap(resource_path("./asset/developer_image.png"))  # Provide the path to your developer image
-        dev_image_label.setPixmap(dev_image_pixmap.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        dev_image_label.setPixmap(load_pixmap("developer_image.png", 100))
         dev_image_label.setAlignment(Qt.AlignCenter)
         dev_image_label.mousePressEvent = self.open_developer_website  # Connect the click event
 
@@ -58,8 +82,7 @@ class AboutDialog(QDialog):
 
         # GitHub link with logo
         github_label = QLabel(self)
-        github_pixmap = QPixmap(resource_path("./asset/github_icon.png"))  # Provide the path to your GitHub logo image
-        github_label.setPixmap(github_pixmap.scaled(150, 150, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        github_label.setPixmap(load_pixmap("github_icon.png", 150))
         github_label.setAlignment(Qt.AlignCenter)
         github_label.mousePressEvent = self.open_github_link  # Connect the click event
 
@@ -86,19 +109,18 @@ class MongoDBExporter(QMainWindow):
     def __init__(self):
         super().__init__()
 
-        self.setWindowTitle("MongoDB Exporter 2.3.0")
+        self.setWindowTitle("MongoDB Exporter 2.4.0")
         self.setGeometry(100, 100, 600, 400)
 
         # Set window icon (favicon)
-        self.setWindowIcon(QIcon(resource_path("./asset/favicon.png")))  # Provide the path to your favicon file
+        self.setWindowIcon(load_icon("favicon.png"))
 
         # Main layout
         main_layout = QVBoxLayout()
 
         # An image as a watermark
         watermark_image = QLabel(self)
-        watermark_pixmap = QPixmap(resource_path('./asset/mongo_icon.png'))
-        watermark_image.setPixmap(watermark_pixmap)
+        watermark_image.setPixmap(load_pixmap("mongo_icon.png"))
         watermark_image.setAttribute(Qt.WA_TranslucentBackground)
         watermark_image.adjustSize()
 
@@ -113,8 +135,7 @@ class MongoDBExporter(QMainWindow):
         # Title and logo layout
         title_layout = QHBoxLayout()
         self.logo_label = QLabel(self)
-        pixmap = QPixmap(resource_path("./asset/mongo_icon.png"))  # Provide the path to your logo image
-        self.logo_label.setPixmap(pixmap.scaled(64, 64, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        self.logo_label.setPixmap(load_pixmap("mongo_icon.png", 64))
         self.title_label = QLabel("MongoDB Exporter", self)
         self.title_label.setFont(QFont('Roboto', 18, QFont.Bold))
 
@@ -156,6 +177,258 @@ class MongoDBExporter(QMainWindow):
         output_dir_layout.addWidget(self.browse_button)
         main_layout.addLayout(output_dir_layout)
 
+        # Snapshot Repository
+        repository_layout = QHBoxLayout()
+        self.repository_label = QLabel("Snapshot Repository:", self)
+        self.repository_label.setFont(QFont('Roboto', 12))
+        self.repository_input = QLineEdit(self)
+        self.repository_input.setFont(QFont('Roboto', 12))
+        self.repository_input.setPlaceholderText("off - store each export as deduplicated chunks instead of a zip")
+        self.repository_browse_button = QPushButton("Browse", self)
+        self.repository_browse_button.setFont(QFont('Roboto', 12))
+        self.repository_browse_button.clicked.connect(self.browse_repository)
+        self.keep_snapshots_label = QLabel("Keep Snapshots:", self)
+        self.keep_snapshots_label.setFont(QFont('Roboto', 12))
+        self.keep_snapshots_input = QSpinBox(self)
+        self.keep_snapshots_input.setFont(QFont('Roboto', 12))
+        self.keep_snapshots_input.setRange(0, 100000)
+        self.keep_snapshots_input.setSpecialValueText("all")
+        repository_layout.addWidget(self.repository_label)
+        repository_layout.addWidget(self.repository_input)
+        repository_layout.addWidget(self.repository_browse_button)
+        repository_layout.addWidget(self.keep_snapshots_label)
+        repository_layout.addWidget(self.keep_snapshots_input)
+        main_layout.addLayout(repository_layout)
+
+        # Connection Settings
+        connection_layout = QHBoxLayout()
+        self.pool_size_label = QLabel("Pool Size:", self)
+        self.pool_size_label.setFont(QFont('Roboto', 12))
+        self.pool_size_input = QSpinBox(self)
+        self.pool_size_input.setFont(QFont('Roboto', 12))
+        self.pool_size_input.setRange(0, 1000)
+        self.pool_size_input.setSpecialValueText("default")
+        self.read_preference_label = QLabel("Read From:", self)
+        self.read_preference_label.setFont(QFont('Roboto', 12))
+        self.read_preference_input = QComboBox(self)
+        self.read_preference_input.setFont(QFont('Roboto', 12))
+        self.read_preference_input.addItems(["default", *READ_PREFERENCES])
+        self.compressors_label = QLabel("Wire Compression:", self)
+        self.compressors_label.setFont(QFont('Roboto', 12))
+        self.compressors_input = QLineEdit(self)
+        self.compressors_input.setFont(QFont('Roboto', 12))
+        self.compressors_input.setPlaceholderText(",".join(WIRE_COMPRESSORS))
+        connection_layout.addWidget(self.pool_size_label)
+        connection_layout.addWidget(self.pool_size_input)
+        connection_layout.addWidget(self.read_preference_label)
+        connection_layout.addWidget(self.read_preference_input)
+        connection_layout.addWidget(self.compressors_label)
+        connection_layout.addWidget(self.compressors_input)
+        main_layout.addLayout(connection_layout)
+
+        # Cursor Settings
+        cursor_layout = QHBoxLayout()
+        self.batch_size_label = QLabel("Batch Size:", self)
+        self.batch_size_label.setFont(QFont('Roboto', 12))
+        self.batch_size_input = QSpinBox(self)
+        self.batch_size_input.setFont(QFont('Roboto', 12))
+        self.batch_size_input.setRange(1, 1000000)
+        self.batch_size_input.setValue(BATCH_SIZE)
+        self.max_time_label = QLabel("Max Time (ms):", self)
+        self.max_time_label.setFont(QFont('Roboto', 12))
+        self.max_time_input = QSpinBox(self)
+        self.max_time_input.setFont(QFont('Roboto', 12))
+        self.max_time_input.setRange(0, 2147483647)
+        self.max_time_input.setSpecialValueText("none")
+        self.no_cursor_timeout_checkbox = QCheckBox("No cursor timeout", self)
+        self.no_cursor_timeout_checkbox.setFont(QFont('Roboto', 12))
+        cursor_layout.addWidget(self.batch_size_label)
+        cursor_layout.addWidget(self.batch_size_input)
+        cursor_layout.addWidget(self.max_time_label)
+        cursor_layout.addWidget(self.max_time_input)
+        cursor_layout.addWidget(self.no_cursor_timeout_checkbox)
+        main_layout.addLayout(cursor_layout)
+
+        # Parallel Collections
+        workers_layout = QHBoxLayout()
+        self.workers_label = QLabel("Parallel Collections:", self)
+        self.workers_label.setFont(QFont('Roboto', 12))
+        self.workers_input = QSpinBox(self)
+        self.workers_input.setFont(QFont('Roboto', 12))
+        self.workers_input.setRange(1, 64)
+        self.workers_input.setValue(DEFAULT_MAX_WORKERS)
+        workers_layout.addWidget(self.workers_label)
+        workers_layout.addWidget(self.workers_input)
+        main_layout.addLayout(workers_layout)
+
+        # Serialization Pipeline
+        pipeline_layout = QHBoxLayout()
+        self.serializer_processes_label = QLabel("Serializer Processes:", self)
+        self.serializer_processes_label.setFont(QFont('Roboto', 12))
+        self.serializer_processes_input = QSpinBox(self)
+        self.serializer_processes_input.setFont(QFont('Roboto', 12))
+        self.serializer_processes_input.setRange(0, os.cpu_count() or 1)
+        self.serializer_processes_input.setSpecialValueText("off")
+        self.memory_limit_label = QLabel("Memory Limit (MB):", self)
+        self.memory_limit_label.setFont(QFont('Roboto', 12))
+        self.memory_limit_input = QSpinBox(self)
+        self.memory_limit_input.setFont(QFont('Roboto', 12))
+        self.memory_limit_input.setRange(16, 1048576)
+        self.memory_limit_input.setValue(DEFAULT_MEMORY_LIMIT_MB)
+        pipeline_layout.addWidget(self.serializer_processes_label)
+        pipeline_layout.addWidget(self.serializer_processes_input)
+        pipeline_layout.addWidget(self.memory_limit_label)
+        pipeline_layout.addWidget(self.memory_limit_input)
+        main_layout.addLayout(pipeline_layout)
+
+        # Partitions per Collection
+        partitions_layout = QHBoxLayout()
+        self.partitions_label = QLabel("Partitions per Collection:", self)
+        self.partitions_label.setFont(QFont('Roboto', 12))
+        self.partitions_input = QSpinBox(self)
+        self.partitions_input.setFont(QFont('Roboto', 12))
+        self.partitions_input.setRange(1, 64)
+        self.merge_parts_checkbox = QCheckBox("Merge parts", self)
+        self.merge_parts_checkbox.setFont(QFont('Roboto', 12))
+        self.merge_parts_checkbox.setChecked(True)
+        partitions_layout.addWidget(self.partitions_label)
+        partitions_layout.addWidget(self.partitions_input)
+        partitions_layout.addWidget(self.merge_parts_checkbox)
+        main_layout.addLayout(partitions_layout)
+
+        # Rolling Files
+        rolling_layout = QHBoxLayout()
+        self.max_file_size_label = QLabel("Max File Size (MB):", self)
+        self.max_file_size_label.setFont(QFont('Roboto', 12))
+        self.max_file_size_input = QSpinBox(self)
+        self.max_file_size_input.setFont(QFont('Roboto', 12))
+        self.max_file_size_input.setRange(0, 1048576)
+        self.max_file_size_input.setSpecialValueText("off")
+        self.max_file_documents_label = QLabel("Max Documents per File:", self)
+        self.max_file_documents_label.setFont(QFont('Roboto', 12))
+        self.max_file_documents_input = QSpinBox(self)
+        self.max_file_documents_input.setFont(QFont('Roboto', 12))
+        self.max_file_documents_input.setRange(0, 2000000000)
+        self.max_file_documents_input.setSpecialValueText("off")
+        self.offset_index_checkbox = QCheckBox("Offset index", self)
+        self.offset_index_checkbox.setFont(QFont('Roboto', 12))
+        self.offset_index_checkbox.setToolTip("Write an _id index next to each collection (always on for rolled "
+                                              "files) for cli.py lookup and extract")
+        rolling_layout.addWidget(self.max_file_size_label)
+        rolling_layout.addWidget(self.max_file_size_input)
+        rolling_layout.addWidget(self.max_file_documents_label)
+        rolling_layout.addWidget(self.max_file_documents_input)
+        rolling_layout.addWidget(self.offset_index_checkbox)
+        main_layout.addLayout(rolling_layout)
+
+        # Output Format
+        format_layout = QHBoxLayout()
+        self.format_label = QLabel("Output Format:", self)
+        self.format_label.setFont(QFont('Roboto', 12))
+        self.format_input = QComboBox(self)
+        self.format_input.setFont(QFont('Roboto', 12))
+        self.format_input.addItems(OUTPUT_FORMATS)
+        self.format_input.setCurrentText(DEFAULT_OUTPUT_FORMAT)
+        self.canonical_checkbox = QCheckBox("Canonical JSON", self)
+        self.canonical_checkbox.setFont(QFont('Roboto', 12))
+        format_layout.addWidget(self.format_label)
+        format_layout.addWidget(self.format_input)
+        format_layout.addWidget(self.canonical_checkbox)
+        main_layout.addLayout(format_layout)
+
+        # Compression
+        compression_layout = QHBoxLayout()
+        self.compression_label = QLabel("Compression:", self)
+        self.compression_label.setFont(QFont('Roboto', 12))
+        self.compression_input = QComboBox(self)
+        self.compression_input.setFont(QFont('Roboto', 12))
+        self.compression_input.addItems(COMPRESSIONS)
+        self.compression_level_input = QSpinBox(self)
+        self.compression_level_input.setFont(QFont('Roboto', 12))
+        self.compression_level_input.setRange(0, 0)
+        self.compression_input.currentTextChanged.connect(self.update_compression_levels)
+        self.archive_checkbox = QCheckBox("Zip output", self)
+        self.archive_checkbox.setFont(QFont('Roboto', 12))
+        self.archive_checkbox.setChecked(True)
+        compression_layout.addWidget(self.compression_label)
+        compression_layout.addWidget(self.compression_input)
+        compression_layout.addWidget(self.compression_level_input)
+        compression_layout.addWidget(self.archive_checkbox)
+        self.exact_count_checkbox = QCheckBox("Exact counts", self)
+        self.exact_count_checkbox.setFont(QFont('Roboto', 12))
+        compression_layout.addWidget(self.exact_count_checkbox)
+        self.resumable_checkbox = QCheckBox("Resumable", self)
+        self.resumable_checkbox.setFont(QFont('Roboto', 12))
+        self.resumable_checkbox.setChecked(True)
+        compression_layout.addWidget(self.resumable_checkbox)
+        main_layout.addLayout(compression_layout)
+
+        # Zip Method
+        zip_layout = QHBoxLayout()
+        self.zip_method_label = QLabel("Zip Method:", self)
+        self.zip_method_label.setFont(QFont('Roboto', 12))
+        self.zip_method_input = QComboBox(self)
+        self.zip_method_input.setFont(QFont('Roboto', 12))
+        self.zip_method_input.addItems(["auto", *ZIP_METHODS])
+        self.zip_level_input = QSpinBox(self)
+        self.zip_level_input.setFont(QFont('Roboto', 12))
+        self.zip_level_input.setRange(0, 0)
+        self.zip_method_input.currentTextChanged.connect(self.update_zip_levels)
+        zip_layout.addWidget(self.zip_method_label)
+        zip_layout.addWidget(self.zip_method_input)
+        zip_layout.addWidget(self.zip_level_input)
+        main_layout.addLayout(zip_layout)
+
+        # Incremental Export
+        incremental_layout = QHBoxLayout()
+        self.incremental_checkbox = QCheckBox("Incremental", self)
+        self.incremental_checkbox.setFont(QFont('Roboto', 12))
+        self.watermark_label = QLabel("Watermark Field:", self)
+        self.watermark_label.setFont(QFont('Roboto', 12))
+        self.watermark_input = QLineEdit("_id", self)
+        self.watermark_input.setFont(QFont('Roboto', 12))
+        incremental_layout.addWidget(self.incremental_checkbox)
+        incremental_layout.addWidget(self.watermark_label)
+        incremental_layout.addWidget(self.watermark_input)
+        self.follow_checkbox = QCheckBox("Follow changes", self)
+        self.follow_checkbox.setFont(QFont('Roboto', 12))
+        self.follow_checkbox.setToolTip("After the export, keep writing the change stream until aborted "
+                                        "(needs a replica set)")
+        incremental_layout.addWidget(self.follow_checkbox)
+        main_layout.addLayout(incremental_layout)
+
+        # Collection Patterns
+        patterns_layout = QHBoxLayout()
+        self.include_label = QLabel("Include:", self)
+        self.include_label.setFont(QFont('Roboto', 12))
+        self.include_input = QLineEdit(self)
+        self.include_input.setFont(QFont('Roboto', 12))
+        self.include_input.setPlaceholderText("all collections, e.g. orders, log_*")
+        self.exclude_label = QLabel("Exclude:", self)
+        self.exclude_label.setFont(QFont('Roboto', 12))
+        self.exclude_input = QLineEdit(self)
+        self.exclude_input.setFont(QFont('Roboto', 12))
+        self.exclude_input.setPlaceholderText("e.g. tmp_*")
+        patterns_layout.addWidget(self.include_label)
+        patterns_layout.addWidget(self.include_input)
+        patterns_layout.addWidget(self.exclude_label)
+        patterns_layout.addWidget(self.exclude_input)
+        main_layout.addLayout(patterns_layout)
+
+        # Restore Settings (File ==> Restore), loading into the URI and database above
+        restore_layout = QHBoxLayout()
+        self.restore_label = QLabel("Restore:", self)
+        self.restore_label.setFont(QFont('Roboto', 12))
+        self.drop_checkbox = QCheckBox("Drop existing collections", self)
+        self.drop_checkbox.setFont(QFont('Roboto', 12))
+        self.rebuild_indexes_checkbox = QCheckBox("Rebuild indexes", self)
+        self.rebuild_indexes_checkbox.setFont(QFont('Roboto', 12))
+        self.rebuild_indexes_checkbox.setChecked(True)
+        restore_layout.addWidget(self.restore_label)
+        restore_layout.addWidget(self.drop_checkbox)
+        restore_layout.addWidget(self.rebuild_indexes_checkbox)
+        main_layout.addLayout(restore_layout)
+
         # Export Button
         self.export_button = QPushButton("Export", self)
         self.export_button.setFont(QFont('Roboto', 12))
@@ -177,6 +450,27 @@ class MongoDBExporter(QMainWindow):
         main_layout.addWidget(self.progress_label)
         main_layout.addWidget(self.progress_bar)
 
+        # Per-collection progress, refreshed from the newest engine snapshot on a timer
+        self.progress_model = ProgressTableModel(self)
+        self.progress_table = QTableView(self)
+        self.progress_table.setModel(self.progress_model)
+        self.progress_table.setSortingEnabled(True)
+        self.progress_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.progress_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.progress_table.verticalHeader().setVisible(False)
+        # Fixed sections: sizing to contents would measure every row of a large export on each refresh
+        self.progress_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.progress_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.progress_table.setMinimumHeight(180)
+        main_layout.addWidget(self.progress_table)
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setInterval(PROGRESS_REFRESH_MS)
+        self.progress_timer.timeout.connect(self.refresh_progress)
+        self.progress_thread = None
+        self.progress_snapshot = None
+        self.progress_action = None
+        self.collection_errors = []
+
         # Set central widget
         container = QWidget()
         container.setLayout(main_layout)
@@ -187,6 +481,12 @@ class MongoDBExporter(QMainWindow):
         main_layout.setSpacing(25)
 
         self.export_thread = None
+        self.restore_thread = None
+        # Per-collection watermark fields, query options and change file tuning can only be set in a backup script
+        self.watermark_fields = {}
+        self.collection_options = {}
+        self.roll_size_mb = DEFAULT_ROLL_SIZE_MB
+        self.flush_interval = DEFAULT_FLUSH_INTERVAL
 
         # Create the menu bar
         self.create_menu_bar()
@@ -207,6 +507,20 @@ class MongoDBExporter(QMainWindow):
         load_backup_action.triggered.connect(self.load_backup_script)
         file_menu.addAction(load_backup_action)
 
+        # Create 'Restore' actions
+        restore_folder_action = QAction('Restore from Folder', self)
+        restore_folder_action.triggered.connect(self.restore_from_folder)
+        file_menu.addAction(restore_folder_action)
+
+        restore_zip_action = QAction('Restore from Zip', self)
+        restore_zip_action.triggered.connect(self.restore_from_zip)
+        file_menu.addAction(restore_zip_action)
+
+        # Create 'Resume Export' action
+        resume_action = QAction('Resume Export', self)
+        resume_action.triggered.connect(self.resume_export)
+        file_menu.addAction(resume_action)
+
         # Add Check for Updates action
         check_updates_action = QAction('Check for Updates', self)
         check_updates_action.triggered.connect(self.check_for_updates)
@@ -228,7 +542,41 @@ class MongoDBExporter(QMainWindow):
         backup_data = {
             'uri': self.uri_input.text(),
             'db_name': self.db_name_input.text(),
-            'output_dir': self.output_dir_input.text()
+            'output_dir': self.output_dir_input.text(),
+            'max_workers': self.workers_input.value(),
+            'partitions': self.partitions_input.value(),
+            'merge_parts': self.merge_parts_checkbox.isChecked(),
+            'output_format': self.format_input.currentText(),
+            'canonical_json': self.canonical_checkbox.isChecked(),
+            'compression': self.compression_input.currentText(),
+            'compression_level': self.compression_level_input.value(),
+            'archive': self.archive_checkbox.isChecked(),
+            'zip_method': self.selected_zip_method(),
+            'zip_level': self.selected_zip_level(),
+            'exact_count': self.exact_count_checkbox.isChecked(),
+            'incremental': self.incremental_checkbox.isChecked(),
+            'watermark_field': self.watermark_input.text(),
+            'watermark_fields': self.watermark_fields,
+            'resumable': self.resumable_checkbox.isChecked(),
+            'include': self.patterns(self.include_input),
+            'exclude': self.patterns(self.exclude_input),
+            'collection_options': self.collection_options,
+            'max_pool_size': self.pool_size_input.value() or None,
+            'compressors': self.compressors_input.text() or None,
+            'read_preference': self.selected_read_preference(),
+            'batch_size': self.batch_size_input.value(),
+            'max_time_ms': self.max_time_input.value() or None,
+            'no_cursor_timeout': self.no_cursor_timeout_checkbox.isChecked(),
+            'serializer_processes': self.serializer_processes_input.value(),
+            'memory_limit_mb': self.memory_limit_input.value(),
+            'follow': self.follow_checkbox.isChecked(),
+            'roll_size_mb': self.roll_size_mb,
+            'flush_interval': self.flush_interval,
+            'max_file_size_mb': self.max_file_size_input.value() or None,
+            'max_file_documents': self.max_file_documents_input.value() or None,
+            'offset_index': self.offset_index_checkbox.isChecked(),
+            'repository': self.repository_input.text() or None,
+            'keep_snapshots': self.keep_snapshots_input.value() or None
         }
 
         options = QFileDialog.Options()
@@ -236,8 +584,9 @@ class MongoDBExporter(QMainWindow):
                                                    "JSON Files (*.mdbexport);;All Files (*)",
                                                    options=options)
         if file_name:
+            from bson.json_util import dumps
             with open(file_name, 'w') as file:
-                json.dump(backup_data, file)
+                file.write(dumps(backup_data, indent=4))
             QMessageBox.information(self, "Success", "Backup script created successfully!")
 
     def load_backup_script(self):
@@ -246,11 +595,49 @@ class MongoDBExporter(QMainWindow):
                                                    "JSON Files (*.mdbexport);;All Files (*)",
                                                    options=options)
         if file_name:
+            from bson.json_util import loads
+            # Extended JSON, so collection filters keep their ObjectIds and dates
             with open(file_name, 'r') as file:
-                backup_data = json.load(file)
+                backup_data = loads(file.read())
                 self.uri_input.setText(backup_data['uri'])
                 self.db_name_input.setText(backup_data['db_name'])
                 self.output_dir_input.setText(backup_data['output_dir'])
+                self.workers_input.setValue(backup_data.get('max_workers', DEFAULT_MAX_WORKERS))
+                self.partitions_input.setValue(backup_data.get('partitions', 1))
+                self.merge_parts_checkbox.setChecked(backup_data.get('merge_parts', True))
+                self.format_input.setCurrentText(backup_data.get('output_format', DEFAULT_OUTPUT_FORMAT))
+                self.canonical_checkbox.setChecked(backup_data.get('canonical_json', False))
+                self.compression_input.setCurrentText(backup_data.get('compression', 'none'))
+                if 'compression_level' in backup_data:
+                    self.compression_level_input.setValue(backup_data['compression_level'])
+                self.archive_checkbox.setChecked(backup_data.get('archive', True))
+                self.zip_method_input.setCurrentText(backup_data.get('zip_method') or 'auto')
+                if backup_data.get('zip_level') is not None:
+                    self.zip_level_input.setValue(backup_data['zip_level'])
+                self.exact_count_checkbox.setChecked(backup_data.get('exact_count', False))
+                self.incremental_checkbox.setChecked(backup_data.get('incremental', False))
+                self.watermark_input.setText(backup_data.get('watermark_field', '_id'))
+                self.watermark_fields = backup_data.get('watermark_fields', {})
+                self.resumable_checkbox.setChecked(backup_data.get('resumable', True))
+                self.include_input.setText(", ".join(backup_data.get('include', [])))
+                self.exclude_input.setText(", ".join(backup_data.get('exclude', [])))
+                self.collection_options = backup_data.get('collection_options', {})
+                self.pool_size_input.setValue(backup_data.get('max_pool_size') or 0)
+                self.compressors_input.setText(backup_data.get('compressors') or '')
+                self.read_preference_input.setCurrentText(backup_data.get('read_preference') or 'default')
+                self.batch_size_input.setValue(backup_data.get('batch_size', BATCH_SIZE))
+                self.max_time_input.setValue(backup_data.get('max_time_ms') or 0)
+                self.no_cursor_timeout_checkbox.setChecked(backup_data.get('no_cursor_timeout', False))
+                self.serializer_processes_input.setValue(backup_data.get('serializer_processes', 0))
+                self.memory_limit_input.setValue(backup_data.get('memory_limit_mb', DEFAULT_MEMORY_LIMIT_MB))
+                self.follow_checkbox.setChecked(backup_data.get('follow', False))
+                self.roll_size_mb = backup_data.get('roll_size_mb', DEFAULT_ROLL_SIZE_MB)
+                self.flush_interval = backup_data.get('flush_interval', DEFAULT_FLUSH_INTERVAL)
+                self.max_file_size_input.setValue(int(backup_data.get('max_file_size_mb') or 0))
+                self.max_file_documents_input.setValue(backup_data.get('max_file_documents') or 0)
+                self.offset_index_checkbox.setChecked(backup_data.get('offset_index', False))
+                self.repository_input.setText(backup_data.get('repository') or '')
+                self.keep_snapshots_input.setValue(backup_data.get('keep_snapshots') or 0)
 
             reply = QMessageBox.question(
                 self, 'Start Export', 'Do you want to start the export now?',
@@ -259,11 +646,41 @@ class MongoDBExporter(QMainWindow):
             if reply == QMessageBox.Yes:
                 self.start_export()
 
+    def update_compression_levels(self, compression):
+        self.compression_level_input.setRange(*COMPRESSION_LEVELS[compression])
+        self.compression_level_input.setValue(DEFAULT_COMPRESSION_LEVELS[compression])
+
+    def update_zip_levels(self, method):
+        if method == "auto":
+            self.zip_level_input.setRange(0, 0)
+            return
+        self.zip_level_input.setRange(*ZIP_LEVELS[method])
+        self.zip_level_input.setValue(DEFAULT_ZIP_LEVELS[method])
+
+    def selected_zip_method(self):
+        method = self.zip_method_input.currentText()
+        return None if method == "auto" else method
+
+    def selected_zip_level(self):
+        return None if self.selected_zip_method() is None else self.zip_level_input.value()
+
+    def selected_read_preference(self):
+        read_preference = self.read_preference_input.currentText()
+        return None if read_preference == "default" else read_preference
+
+    def patterns(self, line_edit):
+        return [pattern.strip() for pattern in line_edit.text().split(",") if pattern.strip()]
+
     def browse_output_dir(self):
         directory = QFileDialog.getExistingDirectory(self, "Select Directory")
         if directory:
             self.output_dir_input.setText(directory)
 
+    def browse_repository(self):
+        directory = QFileDialog.getExistingDirectory(self, "Select Snapshot Repository")
+        if directory:
+            self.repository_input.setText(directory)
+
     def confirm_start_export(self):
         reply = QMessageBox.question(
             self, 'Confirm Export', 'Are you sure you want to start the export?',
@@ -272,7 +689,60 @@ class MongoDBExporter(QMainWindow):
         if reply == QMessageBox.Yes:
             self.start_export()
 
-    def start_export(self):
+    def resume_export(self):
+        resume_dir = QFileDialog.getExistingDirectory(self, "Select Interrupted Export Folder",
+                                                      self.output_dir_input.text())
+        if not resume_dir:
+            return
+        if not os.path.exists(os.path.join(resume_dir, CHECKPOINT_FILE)):
+            QMessageBox.critical(self, "Error", "This folder has no interrupted export to resume.")
+            return
+        if not self.output_dir_input.text():
+            self.output_dir_input.setText(os.path.dirname(resume_dir))
+        self.start_export(resume_dir)
+
+    def restore_from_folder(self):
+        source = QFileDialog.getExistingDirectory(self, "Select Export Folder", self.output_dir_input.text())
+        if source:
+            self.start_restore(source)
+
+    def restore_from_zip(self):
+        source, _ = QFileDialog.getOpenFileName(self, "Select Export Zip", self.output_dir_input.text(),
+                                                "Zip Files (*.zip);;All Files (*)")
+        if source:
+            self.start_restore(source)
+
+    def start_restore(self, source):
+        uri = self.uri_input.text()
+        db_name = self.db_name_input.text()
+
+        if not uri or not db_name:
+            QMessageBox.critical(self, "Error", "MongoDB URI and Database Name are required to restore!")
+            return
+
+        reply = QMessageBox.question(
+            self, 'Confirm Restore', f'Restore {os.path.basename(source)} into database "{db_name}"?',
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+
+        from restore_thread import RestoreThread
+        self.export_button.setDisabled(True)
+        self.abort_button.setDisabled(False)
+        self.restore_thread = RestoreThread(source, uri, db_name,
+                                            max_workers=self.workers_input.value(),
+                                            drop=self.drop_checkbox.isChecked(),
+                                            rebuild_indexes=self.rebuild_indexes_checkbox.isChecked(),
+                                            include=self.patterns(self.include_input),
+                                            exclude=self.patterns(self.exclude_input),
+                                            max_pool_size=self.pool_size_input.value() or None)
+        self.start_progress(self.restore_thread, "Restoring")
+        self.restore_thread.finished.connect(self.export_finished)
+        self.restore_thread.error_occurred.connect(self.export_error)
+        self.restore_thread.collection_error.connect(self.collection_error)
+        self.restore_thread.start()
+
+    def start_export(self, resume_dir=None):
         uri = self.uri_input.text()
         db_name = self.db_name_input.text()
         output_dir = self.output_dir_input.text()
@@ -280,32 +750,108 @@ class MongoDBExporter(QMainWindow):
         if not uri or not db_name or not output_dir:
             QMessageBox.critical(self, "Error", "All fields are required!")
         else:
+            from export_thread import ExportThread
+            try:
+                self.export_thread = ExportThread(uri, db_name, output_dir,
+                                                  max_workers=self.workers_input.value(),
+                                                  partitions=self.partitions_input.value(),
+                                                  merge_parts=self.merge_parts_checkbox.isChecked(),
+                                                  output_format=self.format_input.currentText(),
+                                                  canonical_json=self.canonical_checkbox.isChecked(),
+                                                  compression=self.compression_input.currentText(),
+                                                  compression_level=self.compression_level_input.value(),
+                                                  archive=self.archive_checkbox.isChecked(),
+                                                  zip_method=self.selected_zip_method(),
+                                                  zip_level=self.selected_zip_level(),
+                                                  exact_count=self.exact_count_checkbox.isChecked(),
+                                                  incremental=self.incremental_checkbox.isChecked(),
+                                                  watermark_field=self.watermark_input.text(),
+                                                  watermark_fields=self.watermark_fields,
+                                                  resumable=self.resumable_checkbox.isChecked(),
+                                                  resume_dir=resume_dir,
+                                                  include=self.patterns(self.include_input),
+                                                  exclude=self.patterns(self.exclude_input),
+                                                  collection_options=self.collection_options,
+                                                  max_pool_size=self.pool_size_input.value() or None,
+                                                  compressors=self.compressors_input.text() or None,
+                                                  read_preference=self.selected_read_preference(),
+                                                  batch_size=self.batch_size_input.value(),
+                                                  max_time_ms=self.max_time_input.value() or None,
+                                                  no_cursor_timeout=self.no_cursor_timeout_checkbox.isChecked(),
+                                                  serializer_processes=self.serializer_processes_input.value(),
+                                                  memory_limit_mb=self.memory_limit_input.value(),
+                                                  follow=self.follow_checkbox.isChecked(),
+                                                  roll_size_mb=self.roll_size_mb,
+                                                  flush_interval=self.flush_interval,
+                                                  max_file_size_mb=self.max_file_size_input.value() or None,
+                                                  max_file_documents=self.max_file_documents_input.value() or None,
+                                                  offset_index=self.offset_index_checkbox.isChecked(),
+                                                  repository=self.repository_input.text() or None,
+                                                  keep_snapshots=self.keep_snapshots_input.value() or None)
+            except ValueError as e:
+                # Option combinations the engine rejects, e.g. Parquet with an offset index
+                QMessageBox.critical(self, "Error", str(e))
+                return
             self.export_button.setDisabled(True)
             self.abort_button.setDisabled(False)
-            self.export_thread = ExportThread(uri, db_name, output_dir)
-            self.export_thread.update_progress.connect(self.update_progress)
+            self.start_progress(self.export_thread, "Exporting")
             self.export_thread.update_zip_progress.connect(self.update_zip_progress)
             self.export_thread.finished.connect(self.export_finished)
             self.export_thread.error_occurred.connect(self.export_error)
+            self.export_thread.collection_error.connect(self.collection_error)
             self.export_thread.start()
 
-    def update_progress(self, overall_percentage, collection_name, processed_documents, total_documents,
-                        document_percentage):
-        self.progress_label.setText(
-            f"Exporting: {collection_name}.json ({processed_documents}/{total_documents} documents) - Overall {overall_percentage:.2f}%")
-        self.progress_bar.setValue(int(overall_percentage))
-        QApplication.processEvents()
+    def start_progress(self, thread, action):
+        self.progress_model.clear()
+        self.progress_thread = thread
+        self.progress_snapshot = None
+        self.progress_action = action
+        self.collection_errors.clear()
+        self.progress_timer.start()
+
+    def refresh_progress(self):
+        # Snapshots that arrived since the last tick are skipped, only the newest one is shown
+        snapshot = self.progress_thread.snapshot
+        if snapshot is not None and snapshot is not self.progress_snapshot:
+            self.progress_snapshot = snapshot
+            self.progress_model.update(snapshot)
+            states = [stats.state for stats in snapshot.collections.values()]
+            done = states.count("done")
+            running = len(states) - done - states.count("queued") - states.count("failed") - states.count("aborted")
+            self.progress_label.setText(
+                f"{self.progress_action}: {done}/{len(states)} collections done, {running} running - "
+                f"Overall {snapshot.percentage:.2f}%\n"
+                f"{snapshot.documents_per_second:,.0f} docs/s - {format_bytes(snapshot.bytes_per_second)}/s - "
+                f"ETA {format_duration(snapshot.eta)}")
+            self.progress_bar.setValue(int(snapshot.percentage))
+        if not self.progress_thread.isRunning():
+            self.progress_timer.stop()
 
     def update_zip_progress(self, zip_progress, file_name):
-        self.progress_label.setText(f"Zipping: {file_name} - Overall {zip_progress:.2f}%")
+        action = "Storing" if self.repository_input.text() else "Zipping"
+        self.progress_label.setText(f"{action}: {file_name} - Overall {zip_progress:.2f}%")
         self.progress_bar.setValue(zip_progress)
-        QApplication.processEvents()
 
     def export_finished(self, message):
+        # Show the final counts now, before the message, rather than on a later tick that would overwrite it
+        self.progress_timer.stop()
+        self.refresh_progress()
         self.progress_label.setText(message)
         self.export_button.setDisabled(False)
         self.abort_button.setDisabled(True)
-        QMessageBox.information(self, "Success", message)
+        if not self.collection_errors:
+            QMessageBox.information(self, "Success", message)
+            return
+        # One summary for the whole run instead of a dialog per failed collection
+        errors = "\n".join(self.collection_errors[:SUMMARY_ERRORS])
+        if len(self.collection_errors) > SUMMARY_ERRORS:
+            errors += f"\n... and {len(self.collection_errors) - SUMMARY_ERRORS} more"
+        QMessageBox.warning(self, "Finished with errors",
+                            f"{message}\n\n{len(self.collection_errors)} errors occurred:\n{errors}")
+
+    def collection_error(self, message):
+        # The collection is already marked failed in the table; the run carries on
+        self.collection_errors.append(message)
 
     def export_error(self, message):
         self.progress_label.setText("Error occurred!")
@@ -314,15 +860,20 @@ class MongoDBExporter(QMainWindow):
         QMessageBox.critical(self, "Error", f"An error occurred: {message}")
 
     def abort_export(self):
-        if self.export_thread:
+        if self.restore_thread and self.restore_thread.isRunning():
+            self.restore_thread.abort()
+            self.abort_button.setDisabled(True)
+            self.progress_label.setText("Aborting restore...")
+        elif self.export_thread:
             self.export_thread.abort()
             self.abort_button.setDisabled(True)
             self.progress_label.setText("Aborting export...")
 
     def check_for_updates(self):
-        current_version = "2.3.0"  # Replace with your current version
+        current_version = "2.4.0"  # Replace with your current version
         repo = "Sarwarhridoy4/MongoDB-Exporter"  # Replace with your GitHub repo
 
+        from updater import UpdateThread
         self.update_thread = UpdateThread(repo, current_version)
         self.update_thread.update_progress.connect(self.show_update_progress)
         self.update_thread.update_finished.connect(self.update_finished)
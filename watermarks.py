@@ -0,0 +1,71 @@
+import os
+import threading
+
+from bson.json_util import dumps, loads, CANONICAL_JSON_OPTIONS
+
+
+# Kept in the output directory, next to the dated export folders
+WATERMARK_FILE = "watermarks.json"
+# Written into every dated export folder to chain it to the export it continues
+CHAIN_FILE = "incremental.json"
+
+
+class WatermarkStore:
+    """Per-collection high-watermarks of the exports written to one output directory.
+
+    Values are stored as canonical Extended JSON so ObjectIds and dates keep
+    their BSON type between runs.
+    """
+
+    def __init__(self, output_dir, db_name):
+        self.path = os.path.join(output_dir, WATERMARK_FILE)
+        self.lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                self.data = loads(file.read())
+        self.database = self.data.setdefault(db_name, {
+            "last_export": None,
+            "previous_export": None,
+            "last_full_export": None,
+            "collections": {},
+        })
+        self.ranges = {}
+
+    def get(self, collection_name, field):
+        entry = self.database["collections"].get(collection_name)
+        # A different watermark field means the old value can't be compared, start over
+        if entry and entry["field"] == field:
+            return entry["value"]
+        return None
+
+    def set(self, collection_name, field, lower, upper):
+        with self.lock:
+            self.ranges[collection_name] = {"field": field, "from": lower, "to": upper}
+            if upper is not None:
+                self.database["collections"][collection_name] = {"field": field, "value": upper}
+
+    def save(self, export_dir):
+        export_name = os.path.basename(export_dir)
+        with self.lock:
+            full = all(entry["from"] is None for entry in self.ranges.values())
+            if self.database["last_export"] != export_name:
+                self.database["previous_export"] = self.database["last_export"]
+            chain = {
+                "type": "full" if full else "delta",
+                "previous": self.database["previous_export"],
+                "base": None if full else self.database["last_full_export"],
+                "collections": self.ranges,
+            }
+            self.database["last_export"] = export_name
+            if full:
+                self.database["last_full_export"] = export_name
+
+            with open(os.path.join(export_dir, CHAIN_FILE), "w") as file:
+                file.write(dumps(chain, indent=4, json_options=CANONICAL_JSON_OPTIONS))
+
+            # Replace atomically so an interrupted save never loses the previous watermarks
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as file:
+                file.write(dumps(self.data, indent=4, json_options=CANONICAL_JSON_OPTIONS))
+            os.replace(temp_path, self.path)